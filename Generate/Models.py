@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 from typing import List, Optional
 
 class CaptionPoint(BaseModel):
@@ -34,6 +34,33 @@ class MemeCaption5(BaseModel):
     caption4: str
     caption5: str
 
+# Several alternative caption sets returned by a single LLM call
+class CaptionSets(BaseModel):
+    @model_validator(mode="before")
+    @classmethod
+    def wrap_bare_sets(cls, data):
+        # Models sometimes answer with one bare caption set, or a bare list of sets
+        if isinstance(data, list):
+            return {"sets": data}
+        if isinstance(data, dict) and "sets" not in data:
+            return {"sets": [data]}
+        return data
+
+class MemeCaption1Sets(CaptionSets):
+    sets: List[MemeCaption1]
+
+class MemeCaption2Sets(CaptionSets):
+    sets: List[MemeCaption2]
+
+class MemeCaption3Sets(CaptionSets):
+    sets: List[MemeCaption3]
+
+class MemeCaption4Sets(CaptionSets):
+    sets: List[MemeCaption4]
+
+class MemeCaption5Sets(CaptionSets):
+    sets: List[MemeCaption5]
+
 class TemplateUpload(BaseModel):
     name: str
     description: Optional[str] = ""
@@ -1,20 +1,22 @@
-import time
-from deep_translator import (GoogleTranslator)
-from openai import OpenAI
-from sentence_transformers import SentenceTransformer, util
 import re
-import json
-from pydantic import ValidationError
-import os
+import numpy as np
 from Generate.Models import MemeCaption1,MemeCaption2,MemeCaption3,MemeCaption4,MemeCaption5
+from Generate.Models import MemeCaption1Sets,MemeCaption2Sets,MemeCaption3Sets,MemeCaption4Sets,MemeCaption5Sets
 from Generate.rag import *
 from Generate.Helpers import load_templates
-TOKEN1=os.environ.get("TOKEN1")
-TOKEN2=os.environ.get("TOKEN2")
-client = OpenAI(
-    base_url="https://router.huggingface.co/v1",
-    api_key=TOKEN2,
-)
+from Generate.translation import translate
+from Generate.llm import LLM_ATTEMPT_TIMEOUT, LLMError, llm
+from Generate.caption_cache import caption_key, cached_captions, template_id
+
+CAPTION_MODELS = {1: MemeCaption1, 2: MemeCaption2, 3: MemeCaption3, 4: MemeCaption4, 5: MemeCaption5}
+CAPTION_SET_MODELS = {1: MemeCaption1Sets, 2: MemeCaption2Sets, 3: MemeCaption3Sets, 4: MemeCaption4Sets, 5: MemeCaption5Sets}
+# Appended to the prompt when one call should return several alternative caption sets
+SETS_INSTRUCTION = {
+    "en": '\n\nIMPORTANT: Write {sets} different alternatives. Return {{"sets": [...]}} where each element '
+          'is a JSON object in the format above.',
+    "tr": '\n\nÖNEMLİ: {sets} farklı alternatif yaz. {{"sets": [...]}} döndür; her eleman yukarıdaki '
+          'formatta bir JSON nesnesi olsun.',
+}
 
 
 
@@ -23,29 +25,31 @@ def build_meme_recommender(memes: dict):
     Prepares meme embeddings and returns a function to query them.
     """
 
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-
-    # Build embeddings for each meme template
-    meme_embeddings = {}
-    for key, meme in memes.items():
+    # Build embeddings for each meme template (cached on disk by content hash,
+    # apart from the corpus embeddings)
+    keys = list(memes.keys())
+    text_reprs = []
+    for key in keys:
+        meme = memes[key]
         examples_text = " ".join(
             [" ".join([f"{k}: {v}" for k, v in ex.items()]) for ex in meme["examples"]]
         )
-        text_repr = " ".join(meme["tags"]) + " " + meme["explanation"] + " " + examples_text
-        meme_embeddings[key] = model.encode(text_repr, convert_to_tensor=True)
+        text_reprs.append(" ".join(meme["tags"]) + " " + meme["explanation"] + " " + examples_text)
+    meme_embeddings = embed_template_descriptions(text_reprs)
+    meme_norms = np.linalg.norm(meme_embeddings, axis=1)
 
     def find_similar_memes(query: str, top_n: int = None):
         """
         Given a query, return all meme templates ranked by similarity.
         Each result is the full template object with an extra similarity_score.
         """
-        query_emb = model.encode(query, convert_to_tensor=True)
+        query_emb = embed_query(query)[0]
+        scores = meme_embeddings @ query_emb / np.maximum(meme_norms * np.linalg.norm(query_emb), 1e-8)
         results = []
 
-        for key, emb in meme_embeddings.items():
-            score = util.cos_sim(query_emb, emb).item()
+        for key, score in zip(keys, scores):
             meme_with_score = dict(memes[key])  # shallow copy of template
-            meme_with_score["similarity_score"] = round(score, 3)
+            meme_with_score["similarity_score"] = round(float(score), 3)
             meme_with_score["id"] = key
             results.append(meme_with_score)
 
@@ -80,9 +84,61 @@ def clean_caption_text(caption_text):
     return cleaned
 
 
+def format_prompt_context(retrieved, lang):
+    """Retrieved examples for the prompt; Turkish prompts get them in Turkish where precomputed."""
+    return format_context_tr(retrieved) if lang == "tr" else format_context(retrieved)
+
+
+def caption_model(num_captions):
+    """MemeCaptionN response model for num_captions."""
+    if num_captions not in CAPTION_MODELS:
+        raise ValueError("num_captions must be 1, 2, 3, 4, or 5")
+    return CAPTION_MODELS[num_captions]
+
+
+def _caption_list(caption, num_captions):
+    return [clean_caption_text(getattr(caption, f"caption{i}")) for i in range(1, num_captions + 1)]
+
+
+def request_captions(messages, num_captions, temperature, deadline=None):
+    """Ask the LLM for num_captions captions and return them cleaned, in order."""
+    caption = llm.parse(messages, caption_model(num_captions), temperature, deadline)
+    return _caption_list(caption, num_captions)
+
+
+def request_caption_sets(messages, num_captions, temperature, sets=1, lang="en", deadline=None):
+    """Ask for up to `sets` alternative caption lists in one LLM call; return the cleaned lists."""
+    if sets <= 1:
+        return [request_captions(messages, num_captions, temperature, deadline)]
+    caption_model(num_captions)
+    prompt = messages[-1]["content"] + SETS_INSTRUCTION.get(lang, SETS_INSTRUCTION["en"]).format(sets=sets)
+    messages = messages[:-1] + [{**messages[-1], "content": prompt}]
+    # The answer is about `sets` times as long, and so is its generation; an
+    # attempt cut off at the single-set timeout would only be retried
+    result = llm.parse(
+        messages, CAPTION_SET_MODELS[num_captions], temperature, deadline, attempt_timeout=LLM_ATTEMPT_TIMEOUT * sets
+    )
+    if not result.sets:
+        raise LLMError("The LLM returned no caption sets")
+    return [_caption_list(caption, num_captions) for caption in result.sets[:sets]]
+
+
 # Hugging Face text generator (change model if needed)
-def generate_caption(topic,template, template_tags,meme_name, num_captions=2,lang="en"):
-    topicen=GoogleTranslator(source='auto', target='en').translate(text=topic)
+def generate_caption(topic,template, template_tags,meme_name, num_captions=2,lang="en",template_key=None):
+    """Captions for a template, answered from the caption cache when possible.
+
+    template_key identifies the template in the cache; callers without one
+    fall back to its display name.
+    """
+    key = caption_key(template_id(template_key or meme_name, template), topic, lang, "template", num_captions)
+    return cached_captions(
+        key, lambda sets: _generate_caption(topic, template, template_tags, meme_name, num_captions, lang, sets)
+    )
+
+
+def _generate_caption(topic,template, template_tags,meme_name, num_captions=2,lang="en",sets=1):
+    """Return up to `sets` alternative caption lists from one LLM call."""
+    topicen=translate(topic, 'en')
     # Load examples for the given meme template (if available)
     explanation=""
     examples_text = ""
@@ -112,7 +168,7 @@ def generate_caption(topic,template, template_tags,meme_name, num_captions=2,lan
     except Exception:
         # If anything goes wrong loading examples, proceed without them
         examples_text = ""
-    explanationtr=GoogleTranslator(source='auto', target='tr').translate(text=explanation)
+    explanationtr=translate(explanation, 'tr') if lang=="tr" else explanation
     # Build the main prompt (EN default)
     prompt_en = f"""Create {num_captions} funny captions about '{topicen}'.
 
@@ -156,20 +212,20 @@ def generate_caption(topic,template, template_tags,meme_name, num_captions=2,lan
     else:
         prompt += f"\n\nGenerate exactly {num_captions} captions in the JSON format specified above."
     if meme_name=="Batman Slap":
-        retrieved = search(topicen, TOP_K)
-        context = format_context(retrieved)
+        retrieved = search(topicen, TOP_K, vote_boost=VOTE_BOOSTS["caption"])
+        context = format_prompt_context(retrieved, lang)
     elif meme_name=="Drake Hotline":
-        retrieved = search2(topicen, TOP_K)
+        retrieved = search2(topicen, TOP_K, vote_boost=VOTE_BOOSTS["caption"])
 
-        context = format_context(retrieved)
+        context = format_prompt_context(retrieved, lang)
     elif meme_name=="Two Buttons":
-        retrieved = search3(topicen, TOP_K)
+        retrieved = search3(topicen, TOP_K, vote_boost=VOTE_BOOSTS["caption"])
 
-        context = format_context(retrieved)
+        context = format_prompt_context(retrieved, lang)
     else:
         if meme_name!="Distracted Bf":
-            retrieved = searchreusable(topicen,template,meme_name,num_captions, TOP_K)
-            context = format_context(retrieved)
+            retrieved = searchreusable(topicen,template,meme_name,num_captions, TOP_K, vote_boost=VOTE_BOOSTS["caption"])
+            context = format_prompt_context(retrieved, lang)
     if meme_name!="Distracted Bf":
         if lang == "tr":
             messages=[
@@ -198,84 +254,7 @@ def generate_caption(topic,template, template_tags,meme_name, num_captions=2,lan
                     }
                 ]
 
-    # Choose the appropriate model based on number of captions
-    if num_captions == 1:
-        response_model = MemeCaption1
-    elif num_captions == 2:
-        response_model = MemeCaption2
-    elif num_captions == 3:
-        response_model = MemeCaption3
-    elif num_captions == 4:
-        response_model = MemeCaption4
-    elif num_captions == 5:
-        response_model = MemeCaption5
-    else:
-        raise ValueError("num_captions must be 1, 2, or 3")
-    # Retry system with max 5 attempts
-    max_retries = 5
-    retry_count = 0
-    while retry_count < max_retries:
-        try:
-            if lang=="tr":
-                completion = client.beta.chat.completions.parse(
-                    model="deepseek-ai/DeepSeek-V3.1:fireworks-ai",
-                    messages=messages,
-                    response_format=response_model,
-                    temperature=0.6,
-                    
-                )
-                caption = completion.choices[0].message.parsed
-                break;
-            else:
-                completion = client.beta.chat.completions.parse(
-                    model="deepseek-ai/DeepSeek-V3.1:fireworks-ai",
-                    messages=messages,
-                    response_format=response_model,
-                    temperature=0.6,
-                    
-                )
-                caption = completion.choices[0].message.parsed
-                break;
-        except ValidationError as e:
-            try:
-                error=e.errors(include_url=False,include_context=False)[0]
-                clean = error.get("input").strip().strip("```json").strip("```")
-                data = json.loads(clean)
-                caption = response_model(**data)
-                break;
-            except Exception as e:
-                print(f"{str(e)}")
-                raise Exception(f"Failed to generate caption after {max_retries} attempts. Last error: {str(e)}")
-        except Exception as e:
-            retry_count += 1
-            if retry_count >= max_retries:
-                # If we've exhausted all retries, raise the last error
-
-                raise Exception(f"Failed to generate caption after {max_retries} attempts. Last error: {str(e)}")
-            
-            # Wait a bit before retrying (exponential backoff)
-            import time
-            wait_time = min(2 ** retry_count, 10)  # Max 10 seconds wait
-            time.sleep(wait_time)
-            print(f"Attempt {retry_count} failed: {str(e)}. Retrying in {wait_time} seconds...")
-    
-    # Extract captions based on the model used
-    if num_captions == 1:
-        captions = [caption.caption1]
-    elif num_captions == 2:
-        captions = [caption.caption1, caption.caption2]
-    elif num_captions == 3:
-        captions = [caption.caption1, caption.caption2, caption.caption3]
-    elif num_captions == 4:
-        captions = [caption.caption1, caption.caption2, caption.caption3,caption.caption4]
-    elif num_captions == 5:
-        captions = [caption.caption1, caption.caption2, caption.caption3,caption.caption4,caption.caption5]
-    # Clean up each caption to remove any remaining formatting
-    cleaned_captions = [clean_caption_text(cap) for cap in captions]
-    #for caption in cleaned_captions:
-    #    trs=GoogleTranslator(source='en', target='tr').translate(text=caption)
-    #    cleaned_captions_tr.append(trs)
-    return cleaned_captions
+    return request_caption_sets(messages, num_captions, temperature=0.6, sets=sets, lang=lang)
 
 
 
@@ -379,27 +358,15 @@ def generate_captions_no_template(topic: str,blip_caption:str, num_captions: int
             - Return ONLY the JSON object, no extra text.
             - Generate exactly {num_captions} captions, following the JSON format above.
             """
-    # Choose the appropriate response model
-    if num_captions == 1:
-        response_model = MemeCaption1
-    elif num_captions == 2:
-        response_model = MemeCaption2
-    elif num_captions == 3:
-        response_model = MemeCaption3
-    elif num_captions == 4:
-        response_model = MemeCaption4
-    elif num_captions == 5:
-        response_model = MemeCaption5
-    else:
-        raise ValueError("num_captions must be 1, 2,3,4 or 5")
+    # Fail on an unsupported count before spending a retrieval
+    caption_model(num_captions)
     if original_template!='' and meme_name!='Distracted Bf':
-        topicen=GoogleTranslator(source='auto', target='en').translate(text=topic)
-        retrieved = searchreusable(topicen,template,meme_name,num_captions, TOP_K)
-        context = format_context(retrieved)
+        topicen=translate(topic, 'en')
+        retrieved = searchreusable(topicen,template,meme_name,num_captions, TOP_K, vote_boost=VOTE_BOOSTS["no_template"])
+        context = format_prompt_context(retrieved, lang)
     else:
-        retrieved = searchall(topic, TOP_K)
-        context = format_context(retrieved)
-    context = format_context(retrieved)
+        retrieved = searchall(topic, num_captions, TOP_K, vote_boost=VOTE_BOOSTS["no_template"])
+        context = format_prompt_context(retrieved, lang)
     if lang=="tr":
          messages=[
                 {"role": "system", "content": "Bir RAG asistanısın. Sağlanan bağlamı kullan."},
@@ -418,54 +385,23 @@ def generate_captions_no_template(topic: str,blip_caption:str, num_captions: int
                     "content": prompt
                 }
             ]
-    max_retries = 5
-    retry_count = 0
-    while retry_count < max_retries:
-        try:
-            completion = client.beta.chat.completions.parse(
-                model="deepseek-ai/DeepSeek-V3.1:fireworks-ai",
-                messages=messages,
-                response_format=response_model,
-                temperature=0.7,
-            )
-            caption = completion.choices[0].message.parsed
-            break
-        except ValidationError as e:
-            try:
-                error=e.errors(include_url=False,include_context=False)[0]
-                clean = error.get("input").strip().strip("```json").strip("```")
-                data = json.loads(clean)
-                caption = response_model(**data)
-                break;
-            except Exception as e:
-                print(f"{str(e)}")
-                raise Exception(f"Failed to generate caption after {max_retries} attempts. Last error: {str(e)}")
-        except Exception as e:
-            retry_count += 1
-            if retry_count >= max_retries:
-                print(f"{str(e)}")
-                raise Exception(f"Failed after {max_retries} attempts. Last error: {str(e)}")
-            wait_time = min(2 ** retry_count, 10)
-            time.sleep(wait_time)
-
-    # Extract and clean captions
-    if num_captions == 1:
-        captions = [caption.caption1]
-    elif num_captions == 2:
-        captions = [caption.caption1, caption.caption2]
-    elif num_captions == 3:
-        captions = [caption.caption1, caption.caption2, caption.caption3]
-
-    cleaned_captions = [clean_caption_text(c) for c in captions]
-
-    return cleaned_captions
-
-
-def generate_shitpost_captions(topic, template, template_tags, meme_name, num_captions=2, lang="en", style="random"):
+    return request_captions(messages, num_captions, temperature=0.7)
+
+
+def generate_shitpost_captions(topic, template, template_tags, meme_name, num_captions=2, lang="en", style="random", template_key=None):
     """
-    Generate chaotic, absurd, or sarcastic captions for shitposts.
+    Generate chaotic, absurd, or sarcastic captions for shitposts (cached like generate_caption).
     """
-    topicen = GoogleTranslator(source='auto', target='en').translate(text=topic)
+    key = caption_key(template_id(template_key or meme_name, template), topic, lang, f"shitpost:{style}", num_captions)
+    return cached_captions(
+        key,
+        lambda sets: _generate_shitpost_captions(topic, template, template_tags, meme_name, num_captions, lang, style, sets),
+    )
+
+
+def _generate_shitpost_captions(topic, template, template_tags, meme_name, num_captions=2, lang="en", style="random", sets=1):
+    """Return up to `sets` alternative shitpost caption lists from one LLM call."""
+    topicen = translate(topic, 'en')
     
     # Get explanation from templates file
     try:
@@ -541,30 +477,18 @@ def generate_shitpost_captions(topic, template, template_tags, meme_name, num_ca
         
         Generate exactly {num_captions} captions in the JSON format specified above."""
 
-    # Choose the appropriate response model
-    if num_captions == 1:
-        response_model = MemeCaption1
-    elif num_captions == 2:
-        response_model = MemeCaption2
-    elif num_captions == 3:
-        response_model = MemeCaption3
-    elif num_captions == 4:
-        response_model = MemeCaption4
-    elif num_captions == 5:
-        response_model = MemeCaption5
-    else:
-        raise ValueError("num_captions must be 1, 2, 3, 4, or 5")
+    caption_model(num_captions)
 
     # Get RAG context for enhanced creativity
     try:
         if template!='' and meme_name!='Distracted Bf':
-            topicen=GoogleTranslator(source='auto', target='en').translate(text=topic)
-            retrieved = searchreusable(topicen,template,meme_name,num_captions, TOP_K)
-            context = format_context(retrieved)
+            topicen=translate(topic, 'en')
+            retrieved = searchreusable(topicen,template,meme_name,num_captions, TOP_K, vote_boost=VOTE_BOOSTS["shitpost"])
+            context = format_prompt_context(retrieved, lang)
         else:
-            topicen=GoogleTranslator(source='auto', target='en').translate(text=topic)
-            retrieved = searchall(topicen, TOP_K)
-            context = format_context(retrieved)
+            topicen=translate(topic, 'en')
+            retrieved = searchall(topicen, num_captions, TOP_K, vote_boost=VOTE_BOOSTS["shitpost"])
+            context = format_prompt_context(retrieved, lang)
     except Exception:
         context = ""
 
@@ -585,63 +509,16 @@ def generate_shitpost_captions(topic, template, template_tags, meme_name, num_ca
     else:
         messages = [{"role": "user", "content": prompt}]
 
-    # Generate with higher temperature for more creativity
-    max_retries = 5
-    retry_count = 0
-    while retry_count < max_retries:
-        try:
-            completion = client.beta.chat.completions.parse(
-                model="deepseek-ai/DeepSeek-V3.1:fireworks-ai",
-                messages=messages,
-                response_format=response_model,
-                temperature=0.9,  # Higher temperature for more chaos
-            )
-            caption = completion.choices[0].message.parsed
-            break
-        except ValidationError as e:
-            try:
-                error = e.errors(include_url=False, include_context=False)[0]
-                clean = error.get("input").strip().strip("```json").strip("```")
-                data = json.loads(clean)
-                caption = response_model(**data)
-                break
-            except Exception as e:
-                print(f"{str(e)}")
-                raise Exception(f"Failed to generate shitpost caption after {max_retries} attempts. Last error: {str(e)}")
-        except Exception as e:
-            retry_count += 1
-            if retry_count >= max_retries:
-                raise Exception(f"Failed to generate shitpost caption after {max_retries} attempts. Last error: {str(e)}")
-            
-            # Wait before retrying
-            wait_time = min(2 ** retry_count, 10)
-            time.sleep(wait_time)
-            print(f"Shitpost generation attempt {retry_count} failed: {str(e)}. Retrying in {wait_time} seconds...")
-
-    # Extract captions based on the model used
-    if num_captions == 1:
-        captions = [caption.caption1]
-    elif num_captions == 2:
-        captions = [caption.caption1, caption.caption2]
-    elif num_captions == 3:
-        captions = [caption.caption1, caption.caption2, caption.caption3]
-    elif num_captions == 4:
-        captions = [caption.caption1, caption.caption2, caption.caption3, caption.caption4]
-    elif num_captions == 5:
-        captions = [caption.caption1, caption.caption2, caption.caption3, caption.caption4, caption.caption5]
-
-    # Clean up each caption
-    cleaned_captions = [clean_caption_text(cap) for cap in captions]
-    
-    return cleaned_captions
+    # Generate with higher temperature for more chaos
+    return request_caption_sets(messages, num_captions, temperature=0.9, sets=sets, lang=lang)
 
 
 
 def generate_chat(topic,template, template_tags,meme_name, num_captions=2,lang="en"):
-    topicen=GoogleTranslator(source='auto', target='en').translate(text=topic)
+    topicen=translate(topic, 'en')
     # Load examples for the given meme template (if available)
     explanation=""
-    explanationtr=GoogleTranslator(source='auto', target='tr').translate(text=explanation)
+    explanationtr=translate(explanation, 'tr') if lang=="tr" else explanation
     # Build the main prompt (EN default)
     prompt_en = f"""
         You are MemeGPT — you always answer like a meme character:
@@ -687,41 +564,4 @@ def generate_chat(topic,template, template_tags,meme_name, num_captions=2,lang="
                     }
                 ]
 
-    # Choose the appropriate model based on number of captions
-    # Retry system with max 5 attempts
-    max_retries = 5
-    retry_count = 0
-    while retry_count < max_retries:
-        try:
-            if lang=="tr":
-                completion = client.chat.completions.create(
-                    model="deepseek-ai/DeepSeek-V3.1:fireworks-ai",
-                    messages=messages,
-                    temperature=0.6,
-                    
-                )
-                answer = completion.choices[0].message.content
-                break;
-            else:
-                completion = client.chat.completions.create(
-                    model="deepseek-ai/DeepSeek-V3.1:fireworks-ai",
-                    messages=messages,
-                    temperature=0.6,
-                    
-                )
-                answer = completion.choices[0].message.content
-                break;
-        except Exception as e:
-            retry_count += 1
-            if retry_count >= max_retries:
-                # If we've exhausted all retries, raise the last error
-
-                raise Exception(f"Failed to generate caption after {max_retries} attempts. Last error: {str(e)}")
-            
-            # Wait a bit before retrying (exponential backoff)
-            import time
-            wait_time = min(2 ** retry_count, 10)  # Max 10 seconds wait
-            time.sleep(wait_time)
-            print(f"Attempt {retry_count} failed: {str(e)}. Retrying in {wait_time} seconds...")
-    
-    return answer
+    return llm.complete(messages, temperature=0.6)
@@ -0,0 +1,407 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import faiss
+import numpy as np
+
+from Generate.llm import LLM_DEADLINE
+
+# --------------------------
+# CAPTION CACHE
+# --------------------------
+# Popular (template, topic) pairs repeat constantly, and each one costs a full
+# LLM round-trip. Captions are cached per worker under
+# (template, normalized topic, language, style, caption count), where the
+# template is its key plus a hash of the fields its prompt is built from, so
+# editing a template stops its old captions from being served. A key holds
+# CAPTION_CACHE_VARIANTS caption sets, normally all asked for in the one LLM
+# call of its first miss; once it has them all, requests are answered with
+# the sets in turn, so users still see variety (and a regenerate click gets a
+# different set) while most traffic skips the LLM. Entries expire after
+# CAPTION_CACHE_TTL seconds and the least recently used keys are evicted
+# beyond CAPTION_CACHE_SIZE. A key that is not cached yet can still be
+# answered from a similar topic through SemanticTopicIndex.
+CAPTION_CACHE = os.environ.get("CAPTION_CACHE", "true").lower() == "true"
+CAPTION_CACHE_TTL = float(os.environ.get("CAPTION_CACHE_TTL", 6 * 3600))
+CAPTION_CACHE_SIZE = int(os.environ.get("CAPTION_CACHE_SIZE", 2048))  # keys
+CAPTION_CACHE_VARIANTS = int(os.environ.get("CAPTION_CACHE_VARIANTS", 3))
+# Semantic layer: a topic missing from the cache may reuse the captions of a
+# cached topic of the same template, language, style and count whose MiniLM
+# embedding is at least this cosine-similar ("mondays" ~ "monday mornings")
+CAPTION_SEMANTIC_CACHE = os.environ.get("CAPTION_SEMANTIC_CACHE", "true").lower() == "true"
+CAPTION_SEMANTIC_THRESHOLD = float(os.environ.get("CAPTION_SEMANTIC_THRESHOLD", 0.85))
+CAPTION_SEMANTIC_TOPICS = int(os.environ.get("CAPTION_SEMANTIC_TOPICS", 512))  # per template group
+SEMANTIC_NEIGHBOURS = 4
+# Concurrent misses on the same key within a worker share one LLM call
+CAPTION_COALESCE = os.environ.get("CAPTION_COALESCE", "true").lower() == "true"
+# How long a coalesced request waits for the shared call before generating
+# itself; the shared call also translates and retrieves, which the LLM
+# deadline does not bound
+CAPTION_COALESCE_WAIT = float(os.environ.get("CAPTION_COALESCE_WAIT", LLM_DEADLINE + 10))
+# Template fields a caption prompt is built from
+PROMPT_FIELDS = ("name", "file", "captions", "explanation", "examples")
+_SPACES = re.compile(r"\s+")
+_EDGE_PUNCTUATION = ".,!?;:'\"`()[]{}"
+
+
+def normalize_topic(topic):
+    """Case-fold, collapse whitespace and drop surrounding punctuation."""
+    return _SPACES.sub(" ", str(topic).casefold()).strip().strip(_EDGE_PUNCTUATION).strip()
+
+
+def template_id(template_key, template):
+    """Cache identity of a template: its key and a short hash of its PROMPT_FIELDS."""
+    fields = {field: template.get(field) for field in PROMPT_FIELDS} if isinstance(template, dict) else template
+    encoded = json.dumps(fields, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    return (template_key, hashlib.blake2b(encoded, digest_size=8).hexdigest())
+
+
+def caption_key(template, topic, lang, style, num_captions):
+    return (template, normalize_topic(topic), lang, style, num_captions)
+
+
+class CaptionCache:
+    """TTL + LRU cache of caption sets, holding up to `variants` sets per key, served in turn."""
+
+    def __init__(self, maxsize=2048, ttl=6 * 3600, variants=3):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.variants = max(1, variants)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> [expires, [captions, ...], next set to serve]
+        self.hits = 0
+        self.misses = 0
+        self.fills = 0  # misses that only added a variant to a known key
+        self.expired = 0
+        self.evictions = 0
+        self.prefetched = 0  # sets stored beyond the one returned by their generation
+
+    def _live(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= time.monotonic():
+            del self._entries[key]
+            self.expired += 1
+            return None
+        return entry
+
+    def _next_set(self, key, entry):
+        self._entries.move_to_end(key)
+        captions = entry[1][entry[2] % len(entry[1])]
+        entry[2] += 1
+        return list(captions)
+
+    def get(self, key):
+        """Return a copy of the key's next caption set once it has all its variants, else None."""
+        with self._lock:
+            entry = self._live(key)
+            if entry is None or len(entry[1]) < self.variants:
+                self.misses += 1
+                if entry is not None:
+                    self.fills += 1
+                return None
+            self.hits += 1
+            return self._next_set(key, entry)
+
+    def peek(self, key):
+        """get() without touching the hit/miss counters, for the semantic layer."""
+        with self._lock:
+            entry = self._live(key)
+            if entry is None or len(entry[1]) < self.variants:
+                return None
+            return self._next_set(key, entry)
+
+    def missing(self, key):
+        """How many caption sets key still needs (at least 1)."""
+        with self._lock:
+            entry = self._live(key)
+            return max(1, self.variants - (len(entry[1]) if entry is not None else 0))
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._live(key) is not None
+
+    def add(self, key, caption_sets):
+        """Store freshly generated caption sets for key, the first of which was already returned.
+
+        The key's TTL starts with its first set.
+        """
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                entry = [time.monotonic() + self.ttl, [], 0]
+                self._entries[key] = entry
+            # A repeated set still counts as a variant, or a key whose LLM
+            # answers never differ would never be served from the cache
+            added = caption_sets[:self.variants - len(entry[1])]
+            if added:
+                # Serving continues after the set the generating request returned
+                entry[2] = len(entry[1]) + 1
+            entry[1].extend(list(captions) for captions in added)
+            self.prefetched += max(0, len(added) - 1)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": CAPTION_CACHE,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "variants": self.variants,
+            "hits": self.hits,
+            "misses": self.misses,
+            "fills": self.fills,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "prefetched": self.prefetched,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class SemanticTopicIndex:
+    """Cached topics of each (template, lang, style, count) group in a small inner-product index.
+
+    Vectors are L2-normalized, so scores are cosine similarities. A group holds
+    at most max_topics topics; the oldest are dropped first.
+    """
+
+    def __init__(self, cache, threshold=0.85, max_topics=512):
+        self.cache = cache
+        self.threshold = threshold
+        self.max_topics = max_topics
+        self._lock = threading.Lock()
+        self._groups = {}  # group -> (faiss index, OrderedDict topic -> id)
+        self._next_id = 0
+        self.lookups = 0
+        self.hits = 0
+        self.errors = 0
+        self.similarity_sum = 0.0
+
+    @staticmethod
+    def _split(key):
+        template, topic, lang, style, num_captions = key
+        return (template, lang, style, num_captions), topic
+
+    @staticmethod
+    def _embed(topic):
+        # Imported here so the cache module does not load the RAG stack by itself
+        from Generate.rag import embed_query
+        vector = np.array(embed_query(topic), dtype=np.float32)
+        faiss.normalize_L2(vector)
+        return vector
+
+    def _remove(self, group, topic):
+        index, topics = self._groups[group]
+        topic_id = topics.pop(topic, None)
+        if topic_id is not None:
+            index.remove_ids(np.array([topic_id], dtype=np.int64))
+
+    def lookup(self, key):
+        """Captions of the most similar cached topic above the threshold, or None."""
+        group, topic = self._split(key)
+        with self._lock:
+            if group not in self._groups or not self._groups[group][1]:
+                return None
+        self.lookups += 1
+        try:
+            vector = self._embed(topic)
+        except Exception as e:
+            print(f"Warning: semantic caption cache unavailable: {str(e)}")
+            self.errors += 1
+            return None
+        with self._lock:
+            index, topics = self._groups[group]
+            by_id = {topic_id: cached for cached, topic_id in topics.items()}
+            scores, ids = index.search(vector, min(SEMANTIC_NEIGHBOURS, index.ntotal))
+            for score, topic_id in zip(scores[0], ids[0]):
+                if topic_id < 0 or score < self.threshold:
+                    break
+                neighbour = by_id[int(topic_id)]
+                if neighbour == topic:
+                    continue
+                neighbour_key = (group[0], neighbour, *group[1:])
+                captions = self.cache.peek(neighbour_key)
+                if captions is not None:
+                    self.hits += 1
+                    self.similarity_sum += float(score)
+                    return captions
+                if neighbour_key not in self.cache:
+                    # Expired or evicted from the caption cache
+                    self._remove(group, neighbour)
+        return None
+
+    def add(self, key):
+        group, topic = self._split(key)
+        with self._lock:
+            if group in self._groups and topic in self._groups[group][1]:
+                return
+        try:
+            vector = self._embed(topic)
+        except Exception as e:
+            print(f"Warning: semantic caption cache unavailable: {str(e)}")
+            self.errors += 1
+            return
+        with self._lock:
+            if group not in self._groups:
+                self._groups[group] = (faiss.IndexIDMap2(faiss.IndexFlatIP(vector.shape[1])), OrderedDict())
+            index, topics = self._groups[group]
+            if topic in topics:
+                return
+            index.add_with_ids(vector, np.array([self._next_id], dtype=np.int64))
+            topics[topic] = self._next_id
+            self._next_id += 1
+            while len(topics) > self.max_topics:
+                self._remove(group, next(iter(topics)))
+
+    def clear(self):
+        with self._lock:
+            self._groups.clear()
+
+    def stats(self):
+        return {
+            "enabled": CAPTION_SEMANTIC_CACHE,
+            "threshold": self.threshold,
+            "groups": len(self._groups),
+            "topics": sum(len(topics) for _, topics in self._groups.values()),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            "avg_similarity": round(self.similarity_sum / self.hits, 4) if self.hits else 0.0,
+        }
+
+
+class SingleFlight:
+    """Run at most one call per key at a time; concurrent callers of a key wait for and share its result."""
+
+    def __init__(self, wait=35.0):
+        self.wait = wait
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> [done event, result, error]
+        self.calls = 0
+        self.coalesced = 0
+        self.shared = 0  # coalesced callers that got the shared result
+        self.timeouts = 0  # coalesced callers that gave up waiting and ran fn themselves
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = [threading.Event(), None, None]
+                self.calls += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+        if not leader:
+            if not call[0].wait(self.wait):
+                print(f"Warning: shared caption call still running after {self.wait:.0f}s, generating separately")
+                self._count("timeouts")
+                return fn()
+            if call[2] is not None:
+                raise call[2]
+            self._count("shared")
+            return list(call[1])
+        try:
+            call[1] = fn()
+            return call[1]
+        except Exception as e:
+            call[2] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call[0].set()
+
+    def stats(self):
+        return {
+            "enabled": CAPTION_COALESCE,
+            "in_flight": len(self._calls),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "shared": self.shared,
+            "timeouts": self.timeouts,
+        }
+
+
+caption_cache = CaptionCache(CAPTION_CACHE_SIZE, CAPTION_CACHE_TTL, CAPTION_CACHE_VARIANTS)
+topic_index = SemanticTopicIndex(caption_cache, CAPTION_SEMANTIC_THRESHOLD, CAPTION_SEMANTIC_TOPICS)
+in_flight = SingleFlight(CAPTION_COALESCE_WAIT)
+_timing_lock = threading.Lock()
+_generations = 0
+_generation_seconds = 0.0
+
+
+def _record_generation(seconds):
+    global _generations, _generation_seconds
+    with _timing_lock:
+        _generations += 1
+        _generation_seconds += seconds
+
+
+def _generate_and_cache(key, generate):
+    started = time.monotonic()
+    # One call asks for every set the key is missing; the first is this
+    # request's answer and the rest are served to the next requests
+    caption_sets = generate(caption_cache.missing(key) if CAPTION_CACHE else 1)
+    _record_generation(time.monotonic() - started)
+    if CAPTION_CACHE:
+        caption_cache.add(key, caption_sets)
+        if CAPTION_SEMANTIC_CACHE:
+            topic_index.add(key)
+    return caption_sets[0]
+
+
+def cached_captions(key, generate):
+    """Return cached captions for key (or a semantically close topic), or generate and cache them.
+
+    generate(sets) must return a list of up to `sets` alternative caption
+    lists, at least one. Identical misses that arrive while it runs wait for
+    its result instead of calling the LLM again.
+    """
+    if CAPTION_CACHE:
+        captions = caption_cache.get(key)
+        if captions is not None:
+            return captions
+        if CAPTION_SEMANTIC_CACHE:
+            captions = topic_index.lookup(key)
+            if captions is not None:
+                return captions
+    if CAPTION_COALESCE:
+        return in_flight.do(key, lambda: _generate_and_cache(key, generate))
+    return _generate_and_cache(key, generate)
+
+
+def caption_cache_stats():
+    stats = caption_cache.stats()
+    stats["semantic"] = topic_index.stats()
+    stats["single_flight"] = in_flight.stats()
+    lookups = caption_cache.hits + caption_cache.misses
+    answered = caption_cache.hits + topic_index.hits
+    stats["overall_hit_rate"] = round(answered / lookups, 4) if lookups else 0.0
+    # Time a cache answer saved, estimated from the average uncached generation
+    average = _generation_seconds / _generations if _generations else 0.0
+    stats["generations"] = _generations
+    stats["avg_generation_seconds"] = round(average, 3)
+    stats["saved_seconds"] = {
+        "exact": round(caption_cache.hits * average, 1),
+        "semantic": round(topic_index.hits * average, 1),
+        "coalesced": round(in_flight.shared * average, 1),
+    }
+    return stats
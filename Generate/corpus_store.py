@@ -0,0 +1,238 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+# --------------------------
+# COLUMNAR CORPUS STORE
+# --------------------------
+# MemesRagData is converted once into flat arrays that can be memory-mapped:
+#   corpus.strings.bin          utf-8 bytes of every string, back to back
+#   corpus.string_offsets.npy   int64, byte offset of string i (n_strings + 1 entries)
+#   corpus.doc_strings.npy      int64, first string of doc i (n_docs + 1 entries);
+#                               a doc's strings are [title, author, box1, ..., boxN]
+#   corpus.box_count.npy        int16 per doc
+#   corpus.votes.npy            int32 per doc (metadata img-votes)
+#   corpus.views.npy            int32 per doc (metadata views)
+#   corpus.template_id.npy      int16 per doc
+#   corpus.templates.json       template stems and the row segments of each template
+#   corpus.canonical.npy        optional, int64 representative row of each doc's
+#                               near-duplicate cluster (written by dedup.py)
+# build_corpus writes docs template by template, so a template starts with one
+# contiguous row range; append_corpus adds new entries as further segments at
+# the end. Existing rows never move, so row ids held by indexes stay valid.
+CORPUS_PREFIX = "corpus"
+COLUMNS = ("string_offsets", "doc_strings", "box_count", "votes", "views", "template_id")
+
+
+def parse_count(value):
+    """Parse scraped counters such as "1,020" into ints (0 when missing)."""
+    try:
+        return int(str(value).replace(",", ""))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _read_entries(data_dir, stem):
+    with open(os.path.join(data_dir, f"{stem}.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _add_docs(strings, columns, entries, tid):
+    """Append entries of template tid to the open strings file and the column lists."""
+    string_offsets = columns["string_offsets"]
+
+    def add_string(text):
+        data = str(text).encode("utf-8")
+        strings.write(data)
+        string_offsets.append(string_offsets[-1] + len(data))
+
+    for entry in entries:
+        metadata = entry.get("metadata", {})
+        boxes = entry.get("boxes", [])
+        if not isinstance(boxes, list):
+            boxes = []
+        add_string(metadata.get("title", ""))
+        add_string(metadata.get("author", ""))
+        for box in boxes:
+            add_string(box)
+        columns["doc_strings"].append(len(string_offsets) - 1)
+        columns["box_count"].append(len(boxes))
+        columns["votes"].append(parse_count(metadata.get("img-votes")))
+        columns["views"].append(parse_count(metadata.get("views")))
+        columns["template_id"].append(tid)
+
+
+def _publish(base, columns, table):
+    """Write the columns and the template table, replacing the previous ones."""
+    dtypes = {
+        "string_offsets": np.int64,
+        "doc_strings": np.int64,
+        "box_count": np.int16,
+        "votes": np.int32,
+        "views": np.int32,
+        "template_id": np.int16,
+    }
+    for name in COLUMNS:
+        with open(f"{base}.{name}.npy.tmp", "wb") as f:
+            np.save(f, np.asarray(columns[name], dtype=dtypes[name]))
+    with open(base + ".templates.json.tmp", "w", encoding="utf-8") as f:
+        json.dump(table, f)
+    # The template table goes last: CorpusStore checks for it, and it is what
+    # tells readers how many rows exist
+    for name in COLUMNS:
+        os.replace(f"{base}.{name}.npy.tmp", f"{base}.{name}.npy")
+    os.replace(base + ".templates.json.tmp", base + ".templates.json")
+
+
+def build_corpus(data_dir, out_dir):
+    """Convert every MemesRagData JSON file in data_dir into the columnar store."""
+    stems = sorted(Path(f).stem for f in os.listdir(data_dir) if f.endswith(".json"))
+    columns = {name: [] for name in COLUMNS}
+    columns["string_offsets"].append(0)
+    columns["doc_strings"].append(0)
+    segments = []
+
+    os.makedirs(out_dir, exist_ok=True)
+    base = os.path.join(out_dir, CORPUS_PREFIX)
+    # Duplicate clusters of a previous ingestion do not apply to the new rows
+    if os.path.exists(base + ".canonical.npy"):
+        os.remove(base + ".canonical.npy")
+    with open(base + ".strings.bin.tmp", "wb") as strings:
+        for tid, stem in enumerate(stems):
+            start = len(columns["box_count"])
+            _add_docs(strings, columns, _read_entries(data_dir, stem), tid)
+            segments.append([tid, start, len(columns["box_count"])])
+    os.replace(base + ".strings.bin.tmp", base + ".strings.bin")
+    _publish(base, columns, {"templates": stems, "segments": segments})
+
+
+def append_corpus(data_dir, out_dir):
+    """Ingest MemesRagData entries that are not in the corpus yet; return their rows.
+
+    The scraper only ever appends to the JSON files, so every entry past the
+    number already ingested for a template is new, and files without a
+    template are new templates. Rows are added at the end of the corpus.
+    """
+    corpus = CorpusStore(out_dir)
+    first_row = len(corpus)
+    stems = list(corpus.templates)
+    segments = [list(segment) for segment in corpus.segments]
+    columns = {name: getattr(corpus, name).tolist() for name in COLUMNS}
+    base = os.path.join(out_dir, CORPUS_PREFIX)
+
+    # Appending to strings.bin in place is safe: readers map a fixed length,
+    # and bytes past the last published offset are ignored
+    with open(base + ".strings.bin", "ab") as strings:
+        strings.truncate(columns["string_offsets"][-1])
+        for stem in sorted(Path(f).stem for f in os.listdir(data_dir) if f.endswith(".json")):
+            ingested = len(corpus.template_rows(stem)) if corpus.has_template(stem) else 0
+            entries = _read_entries(data_dir, stem)
+            if len(entries) < ingested:
+                raise ValueError(f"{stem}.json lost entries since the last ingestion, rebuild the corpus")
+            if len(entries) == ingested:
+                continue
+            if stem not in stems:
+                stems.append(stem)
+            tid = stems.index(stem)
+            start = len(columns["box_count"])
+            _add_docs(strings, columns, entries[ingested:], tid)
+            segments.append([tid, start, len(columns["box_count"])])
+
+    if len(columns["box_count"]) > first_row:
+        _publish(base, columns, {"templates": stems, "segments": segments})
+    return np.arange(first_row, len(columns["box_count"]), dtype=np.int64)
+
+
+def data_checksums(data_dir):
+    """blake2b digest of every MemesRagData JSON file, by stem."""
+    checksums = {}
+    for name in sorted(os.listdir(data_dir)):
+        if name.endswith(".json"):
+            with open(os.path.join(data_dir, name), "rb") as f:
+                checksums[Path(name).stem] = hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+    return checksums
+
+
+def corpus_exists(directory):
+    return os.path.exists(os.path.join(directory, CORPUS_PREFIX + ".templates.json"))
+
+
+class CorpusStore:
+    """Read-only, memory-mapped view of a corpus written by build_corpus."""
+
+    def __init__(self, directory):
+        base = os.path.join(directory, CORPUS_PREFIX)
+        # The table is read before the columns: an append publishes columns
+        # first, so the columns always hold at least the rows the table lists
+        with open(base + ".templates.json", "r", encoding="utf-8") as f:
+            table = json.load(f)
+        for name in COLUMNS:
+            setattr(self, name, np.load(f"{base}.{name}.npy", mmap_mode="r"))
+        if os.path.getsize(base + ".strings.bin"):
+            self._strings = np.memmap(base + ".strings.bin", dtype=np.uint8, mode="r")
+        else:
+            self._strings = np.zeros(0, dtype=np.uint8)
+        self.templates = table["templates"]
+        self._template_ids = {stem: i for i, stem in enumerate(self.templates)}
+        if "segments" in table:
+            self.segments = [tuple(segment) for segment in table["segments"]]
+        else:
+            # Stores written before append_corpus existed: one range per template
+            starts = table["template_start"]
+            self.segments = [(tid, starts[tid], starts[tid + 1]) for tid in range(len(self.templates))]
+        # Columns may already hold rows of a newer append; the table decides
+        n_docs = max((stop for _, _, stop in self.segments), default=0)
+        self.doc_strings = self.doc_strings[:n_docs + 1]
+        self.string_offsets = self.string_offsets[:int(self.doc_strings[-1]) + 1]
+        for name in ("box_count", "votes", "views", "template_id"):
+            setattr(self, name, getattr(self, name)[:n_docs])
+        self.canonical = None
+        if os.path.exists(base + ".canonical.npy"):
+            # Rows appended after the last dedup run are their own representatives
+            self.canonical = np.load(base + ".canonical.npy", mmap_mode="r")[:n_docs]
+
+    def __len__(self):
+        return len(self.box_count)
+
+    def has_template(self, stem):
+        return stem in self._template_ids
+
+    def template_rows(self, stem):
+        """Return the rows of one template, in ingestion order."""
+        tid = self._template_ids[stem]
+        return np.concatenate(
+            [np.arange(start, stop, dtype=np.int64) for t, start, stop in self.segments if t == tid]
+            or [np.zeros(0, dtype=np.int64)]
+        )
+
+    def _string(self, i):
+        start, stop = self.string_offsets[i], self.string_offsets[i + 1]
+        return self._strings[start:stop].tobytes().decode("utf-8")
+
+    def is_representative(self, rows):
+        """Mask of rows that are not near-duplicates of another (higher-voted) row."""
+        rows = np.asarray(rows)
+        if self.canonical is None:
+            return np.ones(rows.shape, dtype=bool)
+        known = rows < len(self.canonical)
+        return ~known | (self.canonical[np.where(known, rows, 0)] == rows)
+
+    def boxes(self, row):
+        first = int(self.doc_strings[row]) + 2
+        return [self._string(i) for i in range(first, int(self.doc_strings[row + 1]))]
+
+    def doc(self, row):
+        """Rebuild one entry in the scraped MemesRagData layout (without URLs)."""
+        first = int(self.doc_strings[row])
+        return {
+            "metadata": {
+                "views": str(self.views[row]),
+                "img-votes": str(self.votes[row]),
+                "title": self._string(first),
+                "author": self._string(first + 1),
+            },
+            "boxes": self.boxes(row),
+        }
@@ -0,0 +1,160 @@
+import hashlib
+import os
+import re
+
+import numpy as np
+
+from Generate.corpus_store import CORPUS_PREFIX, CorpusStore
+
+# --------------------------
+# NEAR-DUPLICATE DEDUPLICATION
+# --------------------------
+# Each corpus document gets a 64-bit SimHash of its word unigrams and bigrams.
+# Two documents of the same template with the same box count are near
+# duplicates when their hashes differ in at most MAX_HAMMING bits. Candidates
+# are found by banding: split the hash into MAX_HAMMING + 1 bands, and by the
+# pigeonhole principle any such pair agrees exactly on at least one band.
+# Each cluster collapses onto its highest-voted member, and the result is
+# written to corpus.canonical.npy (row -> representative row).
+MAX_HAMMING = 2
+BANDS = MAX_HAMMING + 1
+BAND_BITS = 64 // BANDS
+_WORD = re.compile(r"[\w']+")
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _token_hash(token):
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def simhash(text):
+    words = _WORD.findall(text.lower())
+    # Text without any words (emoji, punctuation) only matches itself
+    tokens = words + [f"{a} {b}" for a, b in zip(words, words[1:])] or [text]
+    weights = np.zeros(64, dtype=np.int32)
+    bits = np.arange(64, dtype=np.uint64)
+    hashes = np.array([_token_hash(t) for t in tokens], dtype=np.uint64)
+    set_bits = (hashes[:, None] >> bits[None, :]) & np.uint64(1)
+    weights += (2 * set_bits.astype(np.int32) - 1).sum(axis=0)
+    return int(((weights > 0).astype(np.uint64) << bits).sum())
+
+
+def hamming(a, b):
+    """Bit distance between uint64 arrays (broadcasting)."""
+    x = np.bitwise_xor(a, b)
+    return _POPCOUNT8[np.ascontiguousarray(x).view(np.uint8)].reshape(x.shape + (8,)).sum(axis=-1)
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def find_near_duplicates(corpus, max_hamming=MAX_HAMMING, rows=None):
+    """Return canonical[row]: the row that represents each document's cluster.
+
+    rows restricts clustering to a subset of the corpus; the result then holds
+    the representative row of each of those rows, in order.
+    """
+    rows = np.arange(len(corpus)) if rows is None else np.asarray(rows, dtype=np.int64)
+    n = len(rows)
+    hashes = np.array([simhash(" ".join(corpus.boxes(row))) for row in rows], dtype=np.uint64)
+    group = np.asarray(corpus.template_id[rows], dtype=np.int64) * 64 + np.asarray(corpus.box_count[rows], dtype=np.int64)
+    parent = np.arange(n)
+
+    # Identical hashes (exact reposts) are merged first; banding then only
+    # compares one member per distinct hash
+    order = np.lexsort((hashes, group))
+    same = np.r_[False, (group[order][1:] == group[order][:-1]) & (hashes[order][1:] == hashes[order][:-1])]
+    run_start = order[np.maximum.accumulate(np.where(~same, np.arange(n), 0))]
+    parent[order] = run_start
+    distinct = order[~same]
+
+    mask = np.uint64((1 << BAND_BITS) - 1)
+    for band in range(BANDS):
+        values = (hashes[distinct] >> np.uint64(band * BAND_BITS)) & mask
+        band_order = np.lexsort((values, group[distinct]))
+        keys = group[distinct][band_order] * (1 << BAND_BITS) + values[band_order].astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        ends = np.r_[starts[1:], len(keys)]
+        for start, end in zip(starts, ends):
+            if end - start < 2:
+                continue
+            members = distinct[band_order[start:end]]
+            member_hashes = hashes[members]
+            for i in range(len(members) - 1):
+                close = hamming(member_hashes[i + 1:], member_hashes[i]) <= max_hamming
+                for j in members[i + 1:][close]:
+                    a, b = _find(parent, members[i]), _find(parent, j)
+                    if a != b:
+                        parent[max(a, b)] = min(a, b)
+
+    roots = np.array([_find(parent, i) for i in range(n)])
+    # Representative of each cluster: most votes, then lowest row
+    votes = np.asarray(corpus.votes[rows], dtype=np.int64)
+    order = np.lexsort((np.arange(n), -votes, roots))
+    first = np.r_[True, roots[order][1:] != roots[order][:-1]]
+    best = np.empty(n, dtype=np.int64)
+    best[roots[order][first]] = order[first]
+    return rows[best[roots]]
+
+
+def _write_canonical(directory, canonical):
+    path = os.path.join(directory, CORPUS_PREFIX + ".canonical.npy")
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, canonical)
+    os.replace(path + ".tmp", path)
+
+
+def dedup_corpus(directory, max_hamming=MAX_HAMMING):
+    """Compute near-duplicate clusters of the corpus in directory and write corpus.canonical.npy."""
+    corpus = CorpusStore(directory)
+    canonical = find_near_duplicates(corpus, max_hamming)
+    _write_canonical(directory, canonical)
+    return dedup_stats(corpus, canonical)
+
+
+def dedup_appended(directory, new_rows, max_hamming=MAX_HAMMING):
+    """Extend corpus.canonical.npy to rows added by append_corpus.
+
+    Only templates that received rows are re-clustered. Existing rows keep
+    their representative, since their vectors are already indexed; a new row
+    whose cluster contains an existing row maps to that row's indexed
+    representative, whatever its votes.
+    Returns the new rows that are representatives themselves.
+    """
+    corpus = CorpusStore(directory)
+    new_rows = np.asarray(new_rows, dtype=np.int64)
+    known = 0 if corpus.canonical is None else len(corpus.canonical)
+    canonical = np.arange(len(corpus), dtype=np.int64)
+    canonical[:known] = corpus.canonical
+    if len(new_rows):
+        templates = np.unique(corpus.template_id[new_rows])
+        rows = np.flatnonzero(np.isin(np.asarray(corpus.template_id), templates))
+        found = find_near_duplicates(corpus, max_hamming, rows)
+        is_new = rows >= known
+        # A cluster with an old row keeps that row's indexed representative,
+        # even when a higher-voted new row heads the cluster now
+        indexed = {}
+        for head, row in zip(found[~is_new].tolist(), rows[~is_new].tolist()):
+            if head not in indexed or canonical[row] == row:
+                indexed[head] = int(canonical[row])
+        canonical[rows[is_new]] = [indexed.get(head, head) for head in found[is_new].tolist()]
+    _write_canonical(directory, canonical)
+    return new_rows[canonical[new_rows] == new_rows]
+
+
+def dedup_stats(corpus, canonical, dim=384):
+    """Documents and float32 index bytes before and after deduplication."""
+    rows = np.arange(len(corpus))
+    indexed = np.asarray(corpus.box_count) > 0
+    kept = indexed & (canonical == rows)
+    return {
+        "documents": int(indexed.sum()),
+        "kept": int(kept.sum()),
+        "removed": int(indexed.sum() - kept.sum()),
+        "index_bytes_before": int(indexed.sum()) * dim * 4,
+        "index_bytes_after": int(kept.sum()) * dim * 4,
+    }
@@ -0,0 +1,172 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+# --------------------------
+# CONTENT-ADDRESSED EMBEDDING CACHE
+# --------------------------
+# Document vectors are stored in append-only shards under one directory:
+#   <shard>.keys.npy   uint8 [n, 16]   blake2b(model name + text) of each row
+#   <shard>.vecs.npy   float32 [n, d]  the embeddings, memory-mapped on load
+# A shard is published by writing its keys file last, so a crashed writer only
+# leaves an orphan .vecs.npy behind. Shard names are random, so several
+# workers can add shards to the same directory at once.
+KEY_BYTES = 16
+
+
+def content_key(model_name, text):
+    return hashlib.blake2b(f"{model_name}\0{text}".encode("utf-8"), digest_size=KEY_BYTES).digest()
+
+
+class EmbeddingCache:
+    """Embeds documents with a model, encoding only texts not seen before."""
+
+    def __init__(self, directory, model_name):
+        self.directory = directory
+        self.model_name = model_name
+        self._lock = threading.Lock()
+        self._shards = []
+        self._rows = {}
+        self.hits = 0
+        self.misses = 0
+        if os.path.isdir(directory):
+            for name in sorted(os.listdir(directory)):
+                if name.endswith(".keys.npy"):
+                    self._load_shard(name[:-len(".keys.npy")])
+
+    def __len__(self):
+        return len(self._rows)
+
+    def stats(self):
+        return {"size": len(self._rows), "shards": len(self._shards), "hits": self.hits, "misses": self.misses}
+
+    def _load_shard(self, shard):
+        base = os.path.join(self.directory, shard)
+        keys = np.load(base + ".keys.npy")
+        vectors = np.load(base + ".vecs.npy", mmap_mode="r")
+        shard_id = len(self._shards)
+        self._shards.append(vectors)
+        for row, key in enumerate(keys):
+            self._rows[key.tobytes()] = (shard_id, row)
+
+    def _write_shard(self, keys, vectors):
+        os.makedirs(self.directory, exist_ok=True)
+        shard = uuid.uuid4().hex
+        base = os.path.join(self.directory, shard)
+        with open(base + ".vecs.npy.tmp", "wb") as f:
+            np.save(f, vectors)
+        os.replace(base + ".vecs.npy.tmp", base + ".vecs.npy")
+        key_array = np.frombuffer(b"".join(keys), dtype=np.uint8).reshape(len(keys), KEY_BYTES)
+        with open(base + ".keys.npy.tmp", "wb") as f:
+            np.save(f, key_array)
+        os.replace(base + ".keys.npy.tmp", base + ".keys.npy")
+        self._load_shard(shard)
+
+    def encode(self, load_model, texts, **kwargs):
+        """Return float32 embeddings for texts, calling model.encode only for cache misses.
+
+        load_model() returns the model; it is only called on a miss, so fully
+        cached texts are embedded without loading it.
+        """
+        keys = [content_key(self.model_name, text) for text in texts]
+        with self._lock:
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in self._rows and key not in missing:
+                    missing[key] = text
+            if missing:
+                new_vectors = load_model().encode(list(missing.values()), convert_to_numpy=True, **kwargs)
+                self._write_shard(list(missing.keys()), np.asarray(new_vectors, dtype=np.float32))
+            self.misses += len(missing)
+            self.hits += len(keys) - len(missing)
+
+            if not keys:
+                if self._shards:
+                    dim = self._shards[0].shape[1]
+                else:
+                    dim = load_model().get_sentence_embedding_dimension()
+                return np.zeros((0, dim), dtype=np.float32)
+            locations = [self._rows[key] for key in keys]
+        shard_ids = np.fromiter((loc[0] for loc in locations), dtype=np.int64, count=len(locations))
+        rows = np.fromiter((loc[1] for loc in locations), dtype=np.int64, count=len(locations))
+        result = np.empty((len(keys), self._shards[shard_ids[0]].shape[1]), dtype=np.float32)
+        for shard_id in np.unique(shard_ids):
+            in_shard = shard_ids == shard_id
+            result[in_shard] = self._shards[shard_id][rows[in_shard]]
+        return result
+
+
+# --------------------------
+# QUERY EMBEDDING CACHE
+# --------------------------
+class QueryEmbeddingCache:
+    """Bounded LRU cache with a TTL for query embeddings, with hit/miss counters."""
+
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, query):
+        with self._lock:
+            entry = self._entries.get(query)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(query)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[query]
+            self.misses += 1
+            return None
+
+    def put(self, query, vector):
+        with self._lock:
+            self._entries[query] = (time.monotonic(), vector)
+            self._entries.move_to_end(query)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def encode(self, load_model, query):
+        """Return the (1, d) embedding of query, loading the model and encoding only on a miss."""
+        vector = self.get(query)
+        if vector is None:
+            vector = load_model().encode([query], convert_to_numpy=True)
+            vector.setflags(write=False)
+            self.put(query, vector)
+        return vector
+
+    def encode_many(self, load_model, queries):
+        """Return the (n, d) embeddings of queries, encoding all misses in one batch."""
+        vectors = [self.get(query) for query in queries]
+        missing = list(dict.fromkeys(q for q, v in zip(queries, vectors) if v is None))
+        if missing:
+            encoded = load_model().encode(missing, convert_to_numpy=True)
+            fresh = {}
+            for query, vector in zip(missing, encoded):
+                vector = vector[None, :]
+                vector.setflags(write=False)
+                self.put(query, vector)
+                fresh[query] = vector
+            vectors = [fresh[q] if v is None else v for q, v in zip(queries, vectors)]
+        return np.vstack(vectors)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,93 @@
+import json
+import os
+import re
+
+import numpy as np
+
+# --------------------------
+# LEXICAL (BM25) INDEX
+# --------------------------
+# An inverted index over the box text of corpus documents, stored as CSR arrays:
+#   <base>.terms.json    vocabulary, term i is row i of the postings
+#   <base>.indptr.npy    int64, postings of term i are [indptr[i], indptr[i + 1])
+#   <base>.rows.npy      int64, corpus row of each posting
+#   <base>.weights.npy   float32, BM25 weight of the term in that document
+# The weights already include idf and length normalization, so the BM25 score
+# of a document is the sum of its posting weights over the query terms.
+BM25_K1 = 1.2
+BM25_B = 0.75
+_WORD = re.compile(r"[\w']+")
+PARTS = ("indptr", "rows", "weights")
+
+
+def tokenize(text):
+    return _WORD.findall(text.lower())
+
+
+class LexicalIndex:
+    """BM25 search over the boxes of a set of corpus rows."""
+
+    def __init__(self, terms, indptr, rows, weights):
+        self.terms = {term: i for i, term in enumerate(terms)}
+        self.indptr = indptr
+        self.rows = rows
+        self.weights = weights
+
+    @classmethod
+    def build(cls, corpus, rows):
+        postings = {}
+        lengths = np.zeros(len(rows), dtype=np.float32)
+        for i, row in enumerate(rows):
+            tokens = tokenize(" ".join(corpus.boxes(int(row))))
+            lengths[i] = len(tokens)
+            for token in tokens:
+                counts = postings.setdefault(token, {})
+                counts[i] = counts.get(i, 0) + 1
+
+        terms = sorted(postings)
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(postings[term]) for term in terms])
+        docs = np.fromiter((i for term in terms for i in postings[term]), dtype=np.int64, count=indptr[-1])
+        tf = np.fromiter((n for term in terms for n in postings[term].values()), dtype=np.float32, count=indptr[-1])
+        df = np.diff(indptr).astype(np.float32)
+        idf = np.log1p((len(rows) - df + 0.5) / (df + 0.5))
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[docs] / max(float(lengths.mean()), 1.0))
+        weights = np.repeat(idf, np.diff(indptr)) * tf * (BM25_K1 + 1) / (tf + norm)
+        return cls(terms, indptr, np.asarray(rows, dtype=np.int64)[docs], weights.astype(np.float32))
+
+    def save(self, base):
+        """Write the index files under base, each replaced atomically."""
+        for name in PARTS:
+            with open(f"{base}.{name}.npy.tmp", "wb") as f:
+                np.save(f, getattr(self, name))
+        with open(base + ".terms.json.tmp", "w", encoding="utf-8") as f:
+            json.dump(list(self.terms), f, ensure_ascii=False)
+        for name in PARTS:
+            os.replace(f"{base}.{name}.npy.tmp", f"{base}.{name}.npy")
+        os.replace(base + ".terms.json.tmp", base + ".terms.json")
+
+    @classmethod
+    def load(cls, base):
+        with open(base + ".terms.json", "r", encoding="utf-8") as f:
+            terms = json.load(f)
+        return cls(terms, *(np.load(f"{base}.{name}.npy", mmap_mode="r") for name in PARTS))
+
+    def search(self, query, k, accept=None):
+        """Return up to k corpus rows by BM25 score, best first.
+
+        accept, when given, maps an array of candidate rows to a boolean mask
+        of the rows allowed in the result.
+        """
+        ids = [self.terms[token] for token in dict.fromkeys(tokenize(query)) if token in self.terms]
+        if not ids:
+            return np.zeros(0, dtype=np.int64)
+        rows = np.concatenate([self.rows[self.indptr[i]:self.indptr[i + 1]] for i in ids])
+        weights = np.concatenate([self.weights[self.indptr[i]:self.indptr[i + 1]] for i in ids])
+        if accept is not None:
+            keep = accept(rows)
+            rows, weights = rows[keep], weights[keep]
+        rows, inverse = np.unique(rows, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights, minlength=len(rows))
+        # Ties keep the lower (earlier ingested) row first
+        order = np.lexsort((rows, -scores))[:k]
+        return rows[order]
@@ -0,0 +1,186 @@
+import json
+import os
+import random
+import threading
+import time
+
+import httpx
+import openai
+from openai import OpenAI
+from pydantic import ValidationError
+
+# --------------------------
+# LLM GATEWAY
+# --------------------------
+# Every caption and chat generator talks to the provider through one pooled
+# client. A call gets a total time budget (LLM_DEADLINE); each attempt is
+# bounded by what is left of it, and retries sleep a jittered exponential
+# backoff only when the backoff still fits in the budget. A slow or failing
+# provider therefore costs a request at most LLM_DEADLINE seconds instead of
+# five unbounded attempts plus up to 30 s of sleeping inside the worker.
+LLM_BASE_URL = os.environ.get("LLM_BASE_URL", "https://router.huggingface.co/v1")
+LLM_MODEL = os.environ.get("LLM_MODEL", "deepseek-ai/DeepSeek-V3.1:fireworks-ai")
+LLM_DEADLINE = float(os.environ.get("LLM_DEADLINE", 25))  # seconds per generation, all attempts
+LLM_ATTEMPT_TIMEOUT = float(os.environ.get("LLM_ATTEMPT_TIMEOUT", 15))  # seconds per attempt
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", 3))
+LLM_MAX_ATTEMPTS = int(os.environ.get("LLM_MAX_ATTEMPTS", 5))
+LLM_BACKOFF_BASE = 0.5  # seconds, doubled per retry
+LLM_BACKOFF_MAX = 4.0
+LLM_POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", 16))  # keep-alive connections per worker
+# Below this many seconds left there is no point starting another attempt
+LLM_MIN_ATTEMPT = 1.0
+
+
+class LLMError(Exception):
+    """The provider did not produce an answer within the attempts or the time budget."""
+
+
+def _retryable(error):
+    # Client errors (bad request, auth, unknown model) fail the same way every time
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    # Client setup errors such as a missing API key, as opposed to API failures
+    if isinstance(error, openai.OpenAIError) and not isinstance(error, openai.APIError):
+        return False
+    return True
+
+
+def _parse_invalid(error, response_model):
+    """Recover structured output the SDK could not validate (e.g. wrapped in ```json fences)."""
+    details = error.errors(include_url=False, include_context=False)[0]
+    clean = details.get("input").strip().strip("```json").strip("```")
+    return response_model.model_validate(json.loads(clean))
+
+
+class LLMGateway:
+    """Pooled, deadline-aware access to the chat completion API, with call counters."""
+
+    def __init__(self, base_url, api_key, model, pool_size=16):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model = model
+        self.pool_size = pool_size
+        self._client = None
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.failures = 0
+        self.deadline_exceeded = 0
+        self.seconds = 0.0
+
+    @property
+    def client(self):
+        """The OpenAI client, created on first use so importing this module needs no API key."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = OpenAI(
+                        base_url=self.base_url,
+                        api_key=self.api_key,
+                        # Retries are done here, within the caller's budget
+                        max_retries=0,
+                        timeout=httpx.Timeout(LLM_ATTEMPT_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+                        http_client=openai.DefaultHttpxClient(
+                            limits=httpx.Limits(
+                                max_connections=self.pool_size,
+                                max_keepalive_connections=self.pool_size,
+                                keepalive_expiry=60,
+                            )
+                        ),
+                    )
+        return self._client
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def _call(self, request, deadline=None, attempt_timeout=None, max_attempts=LLM_MAX_ATTEMPTS):
+        """Run request(timeout) until it succeeds, attempts run out or the budget is spent."""
+        attempt_timeout = LLM_ATTEMPT_TIMEOUT if attempt_timeout is None else attempt_timeout
+        started = time.monotonic()
+        expires = started + (LLM_DEADLINE if deadline is None else deadline)
+        self._count(calls=1)
+        last_error = None
+        try:
+            for attempt in range(1, max_attempts + 1):
+                remaining = expires - time.monotonic()
+                if remaining < LLM_MIN_ATTEMPT:
+                    self._count(deadline_exceeded=1)
+                    break
+                self._count(attempts=1)
+                try:
+                    return request(min(attempt_timeout, remaining))
+                except Exception as e:
+                    last_error = e
+                    if not _retryable(e) or attempt == max_attempts:
+                        break
+                # Full jitter: sleep uniformly up to the exponential cap, never past the budget
+                wait_time = random.uniform(0, min(LLM_BACKOFF_BASE * 2 ** (attempt - 1), LLM_BACKOFF_MAX))
+                if time.monotonic() + wait_time + LLM_MIN_ATTEMPT > expires:
+                    self._count(deadline_exceeded=1)
+                    break
+                print(f"LLM attempt {attempt} failed: {str(last_error)}. Retrying in {wait_time:.1f} seconds...")
+                self._count(retries=1)
+                time.sleep(wait_time)
+        finally:
+            self._count(seconds=time.monotonic() - started)
+        self._count(failures=1)
+        raise LLMError(f"LLM call failed after {time.monotonic() - started:.1f}s. Last error: {str(last_error)}")
+
+    def parse(self, messages, response_model, temperature, deadline=None, attempt_timeout=None):
+        """Structured completion validated into response_model.
+
+        attempt_timeout overrides LLM_ATTEMPT_TIMEOUT for requests whose answers
+        are known to be longer.
+        """
+
+        def request(timeout):
+            try:
+                completion = self.client.with_options(timeout=timeout).beta.chat.completions.parse(
+                    model=self.model,
+                    messages=messages,
+                    response_format=response_model,
+                    temperature=temperature,
+                )
+                return completion.choices[0].message.parsed
+            except ValidationError as e:
+                try:
+                    return _parse_invalid(e, response_model)
+                except Exception as parse_error:
+                    print(f"{str(parse_error)}")
+                    raise
+
+        return self._call(request, deadline, attempt_timeout)
+
+    def complete(self, messages, temperature, deadline=None):
+        """Plain text completion."""
+
+        def request(timeout):
+            completion = self.client.with_options(timeout=timeout).chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=temperature,
+            )
+            return completion.choices[0].message.content
+
+        return self._call(request, deadline)
+
+    def stats(self):
+        return {
+            "model": self.model,
+            "calls": self.calls,
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "failures": self.failures,
+            "deadline_exceeded": self.deadline_exceeded,
+            "avg_seconds": round(self.seconds / self.calls, 3) if self.calls else 0.0,
+        }
+
+
+llm = LLMGateway(LLM_BASE_URL, os.environ.get("TOKEN2"), LLM_MODEL, LLM_POOL_SIZE)
+
+
+def llm_stats():
+    return llm.stats()
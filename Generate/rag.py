@@ -1,13 +1,16 @@
 import random
-from flask import Flask, request, jsonify
-from openai import OpenAI
+import threading
+import time
 import faiss
 import numpy as np
 import json
-from sentence_transformers import SentenceTransformer
 import os
-from deep_translator import (GoogleTranslator)
 from pathlib import Path
+from Generate.corpus_store import CorpusStore, append_corpus, build_corpus, corpus_exists, data_checksums
+from Generate.embed_cache import EmbeddingCache, QueryEmbeddingCache
+from Generate.dedup import dedup_appended, dedup_corpus
+from Generate.lexical import LexicalIndex
+from Generate.translation import translate_precomputed
 
 # --------------------------
 # CONFIG
@@ -15,33 +18,141 @@ from pathlib import Path
 # Get the directory where this script is located
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
-DATA_FILE = os.path.join(SCRIPT_DIR, "MemesRagData", "Batman-Slapping-Robin.json")   
-DATA_FILE2 = os.path.join(SCRIPT_DIR, "MemesRagData", "Drake-Hotline-Bling.json")   
-DATA_FILE3 = os.path.join(SCRIPT_DIR, "MemesRagData", "Two-Buttons.json")
-DATA_FILE4 = os.path.join(SCRIPT_DIR, "MemesRagData", "UNO-Draw-25-Cards.json")   
-DATA_FILE5 = os.path.join(SCRIPT_DIR, "MemesRagData", "Left-Exit-12-Off-Ramp.json")   
+DATA_DIR = os.path.join(SCRIPT_DIR, "MemesRagData")
+INDEX_DIR = os.path.join(SCRIPT_DIR, "RagIndex")  # prebuilt per-template indexes
+EMBED_CACHE_DIR = os.path.join(INDEX_DIR, "embeddings")  # document vectors by content hash
+# Template descriptions for the template recommender, kept apart so embedding
+# a few dozen of them does not load the corpus-wide cache into the worker
+TEMPLATE_EMBED_CACHE_DIR = os.path.join(INDEX_DIR, "template_embeddings")
 EMB_MODEL = "all-MiniLM-L6-v2"  # CPU-friendly embedding model
-INDEX_FILE = "faiss.index"  # optional if you want persistence
 TOP_K = 10 # number of docs to retrieve
+MAX_CAPTIONS = 5  # MemeCaption1..MemeCaption5
+GLOBAL_INDEX = "_all"  # file prefix of the cross-template index in INDEX_DIR
+HNSW_M = 32  # graph degree of the cross-template HNSW index
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 128
+# Vector storage of the indexes: "flat" (float32), "sq8" (int8 scalar quantizer,
+# 4x smaller) or "pq" (product quantizer, PQ_M bytes per vector)
+INDEX_TYPES = ("flat", "sq8", "pq")
+TEMPLATE_INDEX_TYPE = os.environ.get("RAG_TEMPLATE_INDEX_TYPE", "flat")
+GLOBAL_INDEX_TYPE = os.environ.get("RAG_GLOBAL_INDEX_TYPE", "flat")
+PQ_M = 48  # sub-quantizers of "pq" indexes (8 of the 384 dimensions each)
+PQ_MIN_TRAIN = 39 * 256  # smaller sets cannot train 256 PQ centroids and fall back to sq8
+# Memory-map prebuilt indexes read-only so gunicorn workers share their pages
+INDEX_MMAP = os.environ.get("RAG_INDEX_MMAP", "true").lower() == "true"
+VOTE_BOOST = 0.02  # default weight of the log(1 + img-votes) prior in searchall
+VOTE_OVERSAMPLE = 5  # candidates fetched per requested result when reranking
+# Vote prior weight per caption endpoint; 0 keeps the pure semantic order
+VOTE_BOOSTS = {
+    "caption": float(os.environ.get("RAG_VOTE_BOOST_CAPTION", 0.01)),
+    "no_template": float(os.environ.get("RAG_VOTE_BOOST_NO_TEMPLATE", VOTE_BOOST)),
+    "shitpost": float(os.environ.get("RAG_VOTE_BOOST_SHITPOST", 0.0)),
+}
+# Fuse dense hits with BM25 hits over the box text, which rescues short or very
+# specific topics ("Elon", "Fauci") that MiniLM alone embeds poorly
+HYBRID_SEARCH = os.environ.get("RAG_HYBRID_SEARCH", "true").lower() == "true"
+HYBRID_DEPTH = 3  # candidates per requested result taken from each ranking
+RRF_K = 60  # reciprocal-rank fusion constant
+LEXICAL_INDEX = "_lexical"  # file prefix of the BM25 index in INDEX_DIR
+EXACT_SEARCH_LIMIT = 4096  # box counts this rare are scanned exactly instead of via HNSW
+QUERY_CACHE_SIZE = int(os.environ.get("RAG_QUERY_CACHE_SIZE", 2048))  # cached query embeddings
+QUERY_CACHE_TTL = int(os.environ.get("RAG_QUERY_CACHE_TTL", 6 * 3600))  # seconds
 
-# --------------------------
-# LOAD EMBEDDING MODEL
-# --------------------------
-embed_model = SentenceTransformer(EMB_MODEL)
+# Templates whose RAG data file does not share the stem of the template image
+TEMPLATE_DATA_FILES = {
+    "Batman Slap": "Batman-Slapping-Robin",
+    "Drake Hotline": "Drake-Hotline-Bling",
+    "Two Buttons": "Two-Buttons",
+    "Uno Card": "UNO-Draw-25-Cards",
+    "Road Division": "Left-Exit-12-Off-Ramp",
+}
 
 # --------------------------
-# LOAD DATA
+# LAZY RESOURCE REGISTRY
 # --------------------------
-with open(DATA_FILE, "r", encoding="utf-8") as f:
-    dataset = json.load(f)
-with open(DATA_FILE2, "r", encoding="utf-8") as f:
-    dataset2 = json.load(f)
-with open(DATA_FILE3, "r", encoding="utf-8") as f:
-    dataset3 = json.load(f)
-with open(DATA_FILE4, "r", encoding="utf-8") as f:
-    dataset4 = json.load(f)
-with open(DATA_FILE5, "r", encoding="utf-8") as f:
-    dataset5 = json.load(f)
+# Nothing heavy happens at import time: the embedding model, the corpus and
+# every index are created by their factory on first use (or by warm_up()) and
+# then shared by all requests of the worker. Each key has its own lock, so a
+# slow load (the embedding model, an index built inside a request) only blocks
+# the requests that need that same resource.
+_registry_lock = threading.Lock()
+_resources = {}
+_resource_locks = {}
+_generation = 0  # bumped by reset_resources()
+_kept = frozenset()  # keys the last reset_resources() kept
+
+def lazy_resource(key, factory):
+    """Return the resource registered under key, creating it with factory() on first use."""
+    try:
+        return _resources[key]
+    except KeyError:
+        pass
+    with _registry_lock:
+        lock = _resource_locks.setdefault(key, threading.Lock())
+    with lock:
+        if key in _resources:
+            return _resources[key]
+        generation = _generation
+        resource = factory()
+        with _registry_lock:
+            # A reset during the load means the resource may come from replaced files:
+            # serve it to this caller, but let the next one load the current version
+            if generation == _generation or key in _kept:
+                _resources[key] = resource
+        return resource
+
+def reset_resources(keep=()):
+    """Forget every loaded resource except those in keep, so the next use reloads it from disk."""
+    global _generation, _kept
+    with _registry_lock:
+        _generation += 1
+        _kept = frozenset(keep)
+        for key in [key for key in _resources if key not in keep]:
+            del _resources[key]
+
+def _load_embed_model():
+    # Imported here because sentence_transformers pulls in torch
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMB_MODEL)
+
+def get_embed_model():
+    return lazy_resource("embed_model", _load_embed_model)
+
+def get_embedding_cache():
+    return lazy_resource("embedding_cache", lambda: EmbeddingCache(EMBED_CACHE_DIR, EMB_MODEL))
+
+def embed_documents(documents):
+    """Embed documents for an index, reusing cached vectors of unchanged texts."""
+    return get_embedding_cache().encode(get_embed_model, documents)
+
+def get_template_embedding_cache():
+    return lazy_resource("template_embedding_cache", lambda: EmbeddingCache(TEMPLATE_EMBED_CACHE_DIR, EMB_MODEL))
+
+def embed_template_descriptions(descriptions):
+    """Embed template descriptions for the recommender through their own small cache."""
+    return get_template_embedding_cache().encode(get_embed_model, descriptions)
+
+# Topics repeat within a request (caption + shitpost context) and across users,
+# so query vectors are kept in a small in-process LRU
+query_cache = QueryEmbeddingCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+
+def embed_query(query):
+    """Return the (1, d) embedding of a search query."""
+    return query_cache.encode(get_embed_model, query)
+
+def embed_queries(queries):
+    """Return the (n, d) embeddings of several queries, encoding the misses in one batch."""
+    return query_cache.encode_many(get_embed_model, queries)
+
+def cache_stats():
+    """Hit/miss counters of the retrieval caches, for monitoring."""
+    stats = {"query_embeddings": query_cache.stats()}
+    if "embedding_cache" in _resources:
+        stats["document_embeddings"] = get_embedding_cache().stats()
+    if "template_embedding_cache" in _resources:
+        stats["template_embeddings"] = get_template_embedding_cache().stats()
+    return stats
+
 # Convert dataset objects into strings for embedding
 def serialize_doc(obj,capcount):
     parts = []
@@ -53,110 +164,604 @@ def serialize_doc(obj,capcount):
             parts.append(caption_str)
     return " | ".join(parts)
 
-documents = [serialize_doc(d,2) for d in dataset]
-documents2 = [serialize_doc(d,2) for d in dataset2]
-documents3 = [serialize_doc(d,3) for d in dataset3]
 # --------------------------
-# BUILD OR LOAD FAISS INDEX
+# PERSISTENT INDEX STORE
 # --------------------------
-doc_embeddings = embed_model.encode(documents, convert_to_numpy=True)
-doc_embeddings2 = embed_model.encode(documents2, convert_to_numpy=True)
-doc_embeddings3 = embed_model.encode(documents3, convert_to_numpy=True)
+# MemesRagData is ingested once into the columnar corpus (see corpus_store.py),
+# then one FAISS index + corpus row map per (template file stem, caption count)
+# holding only that template's documents with exactly that many boxes, and one
+# cross-template index are written to INDEX_DIR by build_all_indexes()
+# and loaded into memory on first use. New scraped entries are added in place
+# with append_new_data(). setup/build_rag_index.py runs both offline.
+
+def template_data_stem(template: str, templateobject=None):
+    """Return the MemesRagData file stem used for a template."""
+    if template in TEMPLATE_DATA_FILES:
+        return TEMPLATE_DATA_FILES[template]
+    return Path(templateobject["file"]).stem
 
-dimension = doc_embeddings.shape[1]
-index = faiss.IndexFlatL2(dimension)
-index.add(doc_embeddings)
+def _load_corpus():
+    if not corpus_exists(INDEX_DIR):
+        print("Warning: no prebuilt RAG corpus, ingesting MemesRagData now")
+        build_corpus(DATA_DIR, INDEX_DIR)
+    return CorpusStore(INDEX_DIR)
 
-dimension2 = doc_embeddings2.shape[1]
-index2 = faiss.IndexFlatL2(dimension2)
-index2.add(doc_embeddings2)
+def get_corpus():
+    """Return the memory-mapped RAG corpus, ingesting MemesRagData if it is missing."""
+    current_manifest()
+    return lazy_resource("corpus", _load_corpus)
 
-dimension3 = doc_embeddings3.shape[1]
-index3 = faiss.IndexFlatL2(dimension3)
-index3.add(doc_embeddings3)
+def get_docs(rows):
+    """Fetch corpus entries by row, touching only those rows."""
+    corpus = get_corpus()
+    return [corpus.doc(int(row)) for row in rows]
+
+def template_rows(stem: str, capcount=None):
+    """Corpus rows of one template, optionally only those with capcount boxes.
+
+    Near-duplicates collapsed by the dedup stage are left out.
+    """
+    corpus = get_corpus()
+    rows = corpus.template_rows(stem)
+    rows = rows[corpus.is_representative(rows)]
+    if capcount is not None:
+        rows = rows[corpus.box_count[rows] == capcount]
+    return rows
+
+# --------------------------
+# INDEX VERSIONS
+# --------------------------
+# INDEX_DIR/manifest.json is the commit point of every build: append_new_data()
+# writes new index files under versioned names (Two-Buttons.3.v4.faiss) and
+# only then bumps the manifest, which maps each updated index to its version.
+# Workers compare the manifest's mtime at most every MANIFEST_POLL seconds and
+# drop their loaded corpus and indexes when it changes, so a new version goes
+# live without a restart while requests in flight finish on the old files.
+MANIFEST_FILE = os.path.join(INDEX_DIR, "manifest.json")
+MANIFEST_POLL = 5  # seconds
+# Layout of the artifacts this code reads and writes. Bump it whenever a change
+# to serialize_doc, the dedup stage, the example pools or the index files makes
+# existing artifacts wrong, so stale_reasons() reports them for a rebuild.
+ARTIFACT_FORMAT = 1
+
+_manifest_state = {"manifest": None, "mtime": None, "checked": 0.0}
+_manifest_lock = threading.Lock()
+
+def read_manifest():
+    """Return the manifest on disk, or an empty version-0 one."""
+    try:
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"version": 0, "documents": 0, "indexes": {}}
+
+def write_manifest(manifest):
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    with open(MANIFEST_FILE + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(MANIFEST_FILE + ".tmp", MANIFEST_FILE)
+
+def current_manifest():
+    """Return the manifest this worker serves, reloading resources when a newer one appears."""
+    state = _manifest_state
+    now = time.monotonic()
+    if state["manifest"] is not None and now - state["checked"] < MANIFEST_POLL:
+        return state["manifest"]
+    with _manifest_lock:
+        state["checked"] = now
+        try:
+            mtime = os.stat(MANIFEST_FILE).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if state["manifest"] is None or mtime != state["mtime"]:
+            if state["manifest"] is not None:
+                print("RAG index manifest changed, reloading corpus and indexes")
+                reset_resources(keep=("embed_model", "embedding_cache", "template_embedding_cache"))
+            state["manifest"] = read_manifest()
+            state["mtime"] = mtime
+        return state["manifest"]
+
+def _index_version(name: str):
+    return current_manifest()["indexes"].get(name, 0)
+
+def _versioned(base: str, version: int):
+    return base if not version else f"{base}.v{version}"
+
+def _write_index(index, rows, base: str):
+    """Write base.faiss and base.rows.npy, each replaced atomically."""
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    # Write to temp files first so a crashed build never leaves a torn index behind
+    faiss.write_index(index, base + ".faiss.tmp")
+    with open(base + ".rows.npy.tmp", "wb") as f:
+        np.save(f, rows)
+    os.replace(base + ".faiss.tmp", base + ".faiss")
+    os.replace(base + ".rows.npy.tmp", base + ".rows.npy")
+
+def _read_index(base: str):
+    """Open base.faiss and base.rows.npy for searching.
+
+    With INDEX_MMAP the vectors, HNSW graph and row map stay in the files and
+    are memory-mapped read-only, so every worker on the node shares one copy
+    in the page cache instead of holding its own.
+    """
+    if INDEX_MMAP:
+        return faiss.read_index(base + ".faiss", faiss.IO_FLAG_MMAP_IFC), np.load(base + ".rows.npy", mmap_mode="r")
+    return faiss.read_index(base + ".faiss"), np.load(base + ".rows.npy")
+
+def _remove_versions(base: str, below: int):
+    """Delete files of an index older than version below."""
+    prefix = os.path.basename(base) + ".v"
+    for name in os.listdir(INDEX_DIR):
+        version = name[len(prefix):].split(".", 1)[0]
+        if name.startswith(prefix) and version.isdigit() and int(version) < below:
+            os.remove(os.path.join(INDEX_DIR, name))
+
+# --------------------------
+# INDEX BUILDS
+# --------------------------
+def _template_index_name(stem: str, capcount: int, index_type="flat"):
+    return f"{stem}.{capcount}" + ("" if index_type == "flat" else f".{index_type}")
+
+def _global_index_name(index_type="flat"):
+    return GLOBAL_INDEX + ("" if index_type == "flat" else f".{index_type}")
+
+def make_index(vectors, index_type="flat", hnsw=False):
+    """Build a FAISS L2 index over vectors with the storage named by index_type.
+
+    hnsw=True puts an HNSW graph over the storage. Sets too small to train a
+    product quantizer are stored as sq8 instead.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+    d = vectors.shape[1]
+    if index_type == "pq" and len(vectors) < PQ_MIN_TRAIN:
+        index_type = "sq8"
+    if index_type == "sq8" and not len(vectors):
+        index_type = "flat"
+    if index_type == "flat":
+        index = faiss.IndexHNSWFlat(d, HNSW_M) if hnsw else faiss.IndexFlatL2(d)
+    elif index_type == "sq8":
+        qtype = faiss.ScalarQuantizer.QT_8bit
+        index = faiss.IndexHNSWSQ(d, qtype, HNSW_M) if hnsw else faiss.IndexScalarQuantizer(d, qtype)
+    else:
+        index = faiss.IndexHNSWPQ(d, PQ_M, HNSW_M) if hnsw else faiss.IndexPQ(d, PQ_M, 8)
+    if hnsw:
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+def _embed_rows(rows, capcount=None):
+    """Embed corpus rows as serialized documents (with their own box count by default)."""
+    corpus = get_corpus()
+    return embed_documents([
+        serialize_doc({"boxes": corpus.boxes(row)}, capcount or int(corpus.box_count[row])) for row in rows
+    ])
+
+def build_template_index(stem: str, capcount: int, index_type=TEMPLATE_INDEX_TYPE, version=0):
+    """Embed one template's capcount-box documents, build their index and write it to INDEX_DIR."""
+    # serialize_doc is empty for any other box count, so those rows stay out
+    # of the index instead of adding identical junk vectors
+    rows = template_rows(stem, capcount)
+    index = make_index(_embed_rows(rows, capcount), index_type)
+    _write_index(index, rows, os.path.join(INDEX_DIR, _versioned(_template_index_name(stem, capcount, index_type), version)))
+    return index, rows
+
+def _load_template_index(stem: str, capcount: int):
+    name = _template_index_name(stem, capcount, TEMPLATE_INDEX_TYPE)
+    version = _index_version(name)
+    base = os.path.join(INDEX_DIR, _versioned(name, version))
+    if os.path.exists(base + ".faiss") and os.path.exists(base + ".rows.npy"):
+        return _read_index(base)
+    print(f"Warning: no prebuilt {TEMPLATE_INDEX_TYPE} index for {stem} ({capcount} captions), building it now")
+    return build_template_index(stem, capcount, TEMPLATE_INDEX_TYPE, version)
+
+def get_template_index(stem: str, capcount: int):
+    """Return (index, rows) for a template, loading or building it on first use."""
+    current_manifest()
+    return lazy_resource(("template_index", stem, capcount), lambda: _load_template_index(stem, capcount))
+
+def build_global_index(index_type=GLOBAL_INDEX_TYPE, version=0):
+    """Build the cross-template HNSW index used by searchall.
+
+    Every non-empty, deduplicated document of every template is embedded with all of its
+    boxes; the corpus row of each vector is stored next to the index so box
+    counts and votes can be read from the corpus columns at query time.
+    """
+    corpus = get_corpus()
+    rows = np.flatnonzero(np.asarray(corpus.box_count) > 0).astype(np.int64)
+    rows = rows[corpus.is_representative(rows)]
+    index = make_index(_embed_rows(rows), index_type, hnsw=True)
+    _write_index(index, rows, os.path.join(INDEX_DIR, _versioned(_global_index_name(index_type), version)))
+    return index, rows
+
+def _load_global_index():
+    name = _global_index_name(GLOBAL_INDEX_TYPE)
+    version = _index_version(name)
+    base = os.path.join(INDEX_DIR, _versioned(name, version))
+    if os.path.exists(base + ".faiss") and os.path.exists(base + ".rows.npy"):
+        return _read_index(base)
+    print(f"Warning: no prebuilt {GLOBAL_INDEX_TYPE} global index, building it now")
+    return build_global_index(GLOBAL_INDEX_TYPE, version)
+
+def get_global_index():
+    """Return (index, rows) of the cross-template index, loading it on first use."""
+    current_manifest()
+    return lazy_resource("global_index", _load_global_index)
+
+def build_lexical_index(version=0):
+    """Build the BM25 index over the same documents as the global index and write it."""
+    corpus = get_corpus()
+    rows = np.flatnonzero(np.asarray(corpus.box_count) > 0).astype(np.int64)
+    index = LexicalIndex.build(corpus, rows[corpus.is_representative(rows)])
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    index.save(os.path.join(INDEX_DIR, _versioned(LEXICAL_INDEX, version)))
+    return index
+
+def _load_lexical_index():
+    version = _index_version(LEXICAL_INDEX)
+    base = os.path.join(INDEX_DIR, _versioned(LEXICAL_INDEX, version))
+    if os.path.exists(base + ".terms.json"):
+        return LexicalIndex.load(base)
+    print("Warning: no prebuilt lexical index, building it now")
+    return build_lexical_index(version)
+
+def get_lexical_index():
+    """Return the BM25 index over box text, loading it on first use."""
+    current_manifest()
+    return lazy_resource("lexical_index", _load_lexical_index)
+
+def _capcount_selector(rows, capcount: int):
+    """FAISS id selector restricting the global index to one box count."""
+    def factory():
+        ids = np.flatnonzero(get_corpus().box_count[rows] == capcount).astype(np.int64)
+        return faiss.IDSelectorBatch(ids), ids
+    return lazy_resource(("capcount_selector", capcount), factory)
+
+def _build_info():
+    """Manifest fields describing what the artifacts were built from."""
+    return {
+        "format_version": ARTIFACT_FORMAT,
+        "model": EMB_MODEL,
+        "index_types": {"template": TEMPLATE_INDEX_TYPE, "global": GLOBAL_INDEX_TYPE},
+        "data_checksums": data_checksums(DATA_DIR),
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+def build_all_indexes(capcounts=range(1, MAX_CAPTIONS + 1)):
+    """Ingest the corpus and build every index ahead of time (python setup/build_rag_index.py).
+
+    Returns the new manifest, which records the embedding model, index types,
+    checksums of the MemesRagData files and the duration of each stage.
+    """
+    info = _build_info()
+    timings = {}
+    started = stage = time.perf_counter()
+
+    def lap(name):
+        nonlocal stage
+        now = time.perf_counter()
+        timings[name] = round(now - stage, 2)
+        stage = now
+
+    build_corpus(DATA_DIR, INDEX_DIR)
+    print("Built RAG corpus")
+    lap("corpus")
+    stats = dedup_corpus(INDEX_DIR)
+    reset_resources()
+    print(f"Collapsed {stats['removed']} near-duplicates, {stats['kept']} of {stats['documents']} documents left")
+    lap("dedup")
+    for stem in get_corpus().templates:
+        for capcount in capcounts:
+            build_template_index(stem, capcount)
+            print(f"Built index {stem} ({capcount} captions)")
+    lap("template_indexes")
+    for stem in get_corpus().templates:
+        for capcount in capcounts:
+            build_example_pool(stem, capcount)
+    print("Built example pools")
+    lap("example_pools")
+    build_global_index()
+    print("Built global index")
+    lap("global_index")
+    build_lexical_index()
+    print("Built lexical index")
+    lap("lexical_index")
+    timings["total"] = round(time.perf_counter() - started, 2)
+
+    # Rows were renumbered, so every previously appended version is obsolete
+    previous = read_manifest()
+    for name in previous["indexes"]:
+        _remove_versions(os.path.join(INDEX_DIR, name), float("inf"))
+    manifest = {
+        "version": previous["version"] + 1,
+        "documents": len(get_corpus()),
+        "indexes": {},
+        **info,
+        "timings": timings,
+    }
+    write_manifest(manifest)
+    return manifest
+
+def _append_to_index(name: str, new_rows, version: int, indexes, capcount=None):
+    """Add the vectors of new_rows to the current version of an index and write it as version."""
+    old_version = indexes.get(name, 0)
+    old_base = os.path.join(INDEX_DIR, _versioned(name, old_version))
+    # Read into memory: a memory-mapped index cannot grow
+    index, rows = faiss.read_index(old_base + ".faiss"), np.load(old_base + ".rows.npy")
+    index.add(_embed_rows(new_rows, capcount))
+    base = os.path.join(INDEX_DIR, name)
+    _write_index(index, np.concatenate([rows, new_rows]), _versioned(base, version))
+    indexes[name] = version
+    # Workers still on the previous manifest may load old_version; older ones are unused
+    _remove_versions(base, old_version)
+
+def append_new_data(capcounts=range(1, MAX_CAPTIONS + 1)):
+    """Ingest new MemesRagData entries into the existing corpus and indexes (build_rag_index.py --append).
+
+    Only the new entries are embedded and added to the configured template and
+    global indexes; workers switch to the result on their next manifest poll.
+    Templates seen for the first time get their indexes built from scratch.
+    """
+    manifest = read_manifest()
+    if manifest.get("format_version") != ARTIFACT_FORMAT:
+        raise RuntimeError(
+            f"RAG artifacts have format {manifest.get('format_version', 0)}, this code writes {ARTIFACT_FORMAT}: "
+            "run python setup/build_rag_index.py for a full build"
+        )
+    info = _build_info()
+    started = time.perf_counter()
+    new_rows = append_corpus(DATA_DIR, INDEX_DIR)
+    if not len(new_rows):
+        print("No new RAG data")
+        return manifest
+    added = dedup_appended(INDEX_DIR, new_rows)
+    reset_resources(keep=("embed_model", "embedding_cache", "template_embedding_cache"))
+    corpus = get_corpus()
+    version = manifest["version"] + 1
+    indexes = dict(manifest["indexes"])
+    print(f"Appended {len(new_rows)} entries, {len(added)} after near-duplicate collapse")
+
+    for tid in np.unique(corpus.template_id[new_rows]):
+        stem = corpus.templates[tid]
+        in_template = added[corpus.template_id[added] == tid]
+        for capcount in capcounts:
+            name = _template_index_name(stem, capcount, TEMPLATE_INDEX_TYPE)
+            rows = in_template[corpus.box_count[in_template] == capcount]
+            if not os.path.exists(os.path.join(INDEX_DIR, _versioned(name, indexes.get(name, 0)) + ".faiss")):
+                build_template_index(stem, capcount, TEMPLATE_INDEX_TYPE, version)
+                indexes[name] = version
+            elif len(rows):
+                _append_to_index(name, rows, version, indexes, capcount)
+            else:
+                continue
+            build_example_pool(stem, capcount)
+            print(f"Updated index and example pool {stem} ({capcount} captions)")
+
+    name = _global_index_name(GLOBAL_INDEX_TYPE)
+    rows = added[corpus.box_count[added] > 0]
+    if not os.path.exists(os.path.join(INDEX_DIR, _versioned(name, indexes.get(name, 0)) + ".faiss")):
+        build_global_index(GLOBAL_INDEX_TYPE, version)
+        indexes[name] = version
+    elif len(rows):
+        _append_to_index(name, rows, version, indexes)
+    print("Updated global index")
+
+    # BM25 weights depend on corpus-wide statistics, so the lexical index is
+    # rebuilt; it takes seconds and needs no embeddings
+    build_lexical_index(version)
+    _remove_versions(os.path.join(INDEX_DIR, LEXICAL_INDEX), indexes.get(LEXICAL_INDEX, 0))
+    indexes[LEXICAL_INDEX] = version
+    print("Rebuilt lexical index")
+
+    manifest = {
+        **manifest,
+        "version": version,
+        "documents": len(corpus),
+        "indexes": indexes,
+        "data_checksums": info["data_checksums"],
+        "appended_at": info["built_at"],
+        "timings": {**manifest.get("timings", {}), "append": round(time.perf_counter() - started, 2)},
+    }
+    write_manifest(manifest)
+    return manifest
+
+def stale_reasons(capcounts=range(1, MAX_CAPTIONS + 1)):
+    """Why the artifacts in INDEX_DIR do not match this code and MemesRagData (empty when they do)."""
+    manifest = read_manifest()
+    if "model" not in manifest or not corpus_exists(INDEX_DIR):
+        return ["no build manifest"]
+    reasons = []
+    if manifest.get("format_version") != ARTIFACT_FORMAT:
+        reasons.append(f"built with artifact format {manifest.get('format_version', 0)}, this code expects {ARTIFACT_FORMAT}")
+    if manifest["model"] != EMB_MODEL:
+        reasons.append(f"built with {manifest['model']}, configured model is {EMB_MODEL}")
+    built = manifest.get("data_checksums", {})
+    current = data_checksums(DATA_DIR)
+    changed = sorted(stem for stem in built.keys() | current.keys() if built.get(stem) != current.get(stem))
+    if changed:
+        reasons.append(f"MemesRagData changed since the build: {', '.join(changed)}")
+
+    indexes = manifest["indexes"]
+    expected = [_global_index_name(GLOBAL_INDEX_TYPE)] + [
+        _template_index_name(stem, capcount, TEMPLATE_INDEX_TYPE)
+        for stem in CorpusStore(INDEX_DIR).templates
+        for capcount in capcounts
+    ]
+    missing = [name for name in expected if not os.path.exists(os.path.join(INDEX_DIR, _versioned(name, indexes.get(name, 0)) + ".faiss"))]
+    if HYBRID_SEARCH and not os.path.exists(os.path.join(INDEX_DIR, _versioned(LEXICAL_INDEX, indexes.get(LEXICAL_INDEX, 0)) + ".terms.json")):
+        missing.append(LEXICAL_INDEX)
+    if missing:
+        reasons.append(f"{len(missing)} indexes missing, e.g. {missing[0]}")
+    return reasons
+
+def ensure_artifacts(policy="warn"):
+    """Check the prebuilt artifacts at boot.
+
+    policy "warn" only logs stale artifacts (they are rebuilt lazily),
+    "refuse" raises RuntimeError so the app does not start, and "rebuild"
+    runs build_all_indexes() once, with the other workers waiting for it.
+    """
+    reasons = stale_reasons()
+    if not reasons:
+        return
+    for reason in reasons:
+        print(f"Warning: stale RAG artifacts: {reason}")
+    if policy == "warn":
+        print("Warning: searches will build the missing artifacts inside requests; "
+              "run python setup/build_rag_index.py before serving")
+    if policy == "refuse":
+        raise RuntimeError("Stale RAG artifacts, run python setup/build_rag_index.py: " + "; ".join(reasons))
+    if policy == "rebuild":
+        import fcntl
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        with open(os.path.join(INDEX_DIR, "build.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another worker may have finished the rebuild while this one waited
+            if stale_reasons():
+                build_all_indexes()
+
+def warm_up(templates=TEMPLATE_DATA_FILES):
+    """Load the model, corpus and indexes now instead of on the first request.
+
+    templates maps template names to data file stems; their indexes are
+    loaded for the caption count they are normally searched with.
+    """
+    get_embed_model()
+    get_global_index()
+    if HYBRID_SEARCH:
+        get_lexical_index()
+    corpus = get_corpus()
+    for name, stem in templates.items():
+        if corpus.has_template(stem):
+            get_template_index(stem, get_expected_caption_count(name))
 
 
 # --------------------------
 # HELPER: SEARCH
 # --------------------------
-def search(query, k=TOP_K):
-    q_emb = embed_model.encode([query], convert_to_numpy=True)
-    distances, indices = index.search(q_emb, k)
-    results = []
-    for idx in indices[0]:
-        results.append(dataset[idx])
-    return results
-
-def search2(query, k=TOP_K):
-    q_emb = embed_model.encode([query], convert_to_numpy=True)
-    distances, indices = index2.search(q_emb, k)
-    results = []
-    for idx in indices[0]:
-        results.append(dataset2[idx])
-    return results
-
-def search3(query, k=TOP_K):
-    q_emb = embed_model.encode([query], convert_to_numpy=True)
-    distances, indices = index3.search(q_emb, k)
-    results = []
-    for idx in indices[0]:
-        results.append(dataset3[idx])
-    return results
-def searchreusable(query,templateobject,template:str,capcount:int,k=TOP_K):
-    if template=="Uno Card":
-        datasetnew=dataset4
-        documentsnew = [serialize_doc(d,capcount) for d in datasetnew]
-        doc_embeddingsnew = embed_model.encode(documentsnew, convert_to_numpy=True)
-        dimensionnew = doc_embeddingsnew.shape[1]
-        indexnew = faiss.IndexFlatL2(dimensionnew)
-        indexnew.add(doc_embeddingsnew)
-    elif template=="Road Division":
-        datasetnew=dataset5
-        documentsnew = [serialize_doc(d,capcount) for d in datasetnew]
-        doc_embeddingsnew = embed_model.encode(documentsnew, convert_to_numpy=True)
-        dimensionnew = doc_embeddingsnew.shape[1]
-        indexnew = faiss.IndexFlatL2(dimensionnew)
-        indexnew.add(doc_embeddingsnew)
+def get_vote_prior():
+    """log(1 + img-votes) of every corpus row, computed once per worker."""
+    return lazy_resource("vote_prior", lambda: np.log1p(np.asarray(get_corpus().votes, dtype=np.float32)))
+
+def _rank(distances, indices, rows, k, vote_boost):
+    """Turn FAISS candidates into corpus rows per query, best first.
+
+    With vote_boost > 0 every candidate of every query is rescored at once as
+    distance - vote_boost * log(1 + img-votes) before taking the top k.
+    """
+    if len(rows) == 0:
+        return [rows[:0] for _ in indices]
+    missing = indices == -1
+    if vote_boost > 0:
+        prior = get_vote_prior()[rows[np.where(missing, 0, indices)]]
+        distances = distances - vote_boost * prior
+    distances = np.where(missing, np.inf, distances)
+    order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+    ranked = np.take_along_axis(indices, order, axis=1)
+    return [rows[ids[ids != -1]] for ids in ranked]
+
+def _fuse(dense, lexical, k):
+    """Reciprocal-rank fusion of two rankings of corpus rows."""
+    scores = {}
+    for ranking in (dense, lexical):
+        for rank, row in enumerate(ranking.tolist()):
+            scores[row] = scores.get(row, 0.0) + 1.0 / (RRF_K + rank + 1)
+    # sorted() is stable, so ties keep the dense order
+    return np.asarray(sorted(scores, key=scores.get, reverse=True)[:k], dtype=np.int64)
+
+def _hybrid(hits, texts, k, accept):
+    """Fuse each query's dense hits with BM25 hits on its text, when hybrid search is on."""
+    if not HYBRID_SEARCH or texts is None:
+        return [rows[:k] for rows in hits]
+    lexical = get_lexical_index()
+    return [_fuse(rows, lexical.search(text, len(rows) or k, accept), k) for rows, text in zip(hits, texts)]
+
+def _template_hits(q_embs, stem: str, capcount: int, k=TOP_K, vote_boost=0.0, texts=None):
+    """Corpus rows of the k best capcount-box documents of a template, per query.
+
+    texts are the query strings, used for the BM25 side of hybrid search.
+    """
+    index, rows = get_template_index(stem, capcount)
+    if len(rows) == 0:
+        # No capcount-box documents of this template: nothing to rank or fuse
+        return [rows[:0] for _ in q_embs]
+    depth = k * HYBRID_DEPTH if HYBRID_SEARCH and texts is not None else k
+    fetch = depth * VOTE_OVERSAMPLE if vote_boost > 0 else depth
+    distances, indices = index.search(q_embs, fetch)
+    hits = _rank(distances, indices, rows, depth, vote_boost)
+    corpus = get_corpus()
+    tid = corpus.templates.index(stem)
+    return _hybrid(hits, texts, k, lambda r: (corpus.template_id[r] == tid) & (corpus.box_count[r] == capcount))
+
+def _global_hits(q_embs, capcount: int, k=TOP_K, vote_boost=VOTE_BOOST, texts=None):
+    """Corpus rows of the k best capcount-box documents of any template, per query."""
+    index, rows = get_global_index()
+    selector, allowed = _capcount_selector(rows, capcount)
+    depth = k * HYBRID_DEPTH if HYBRID_SEARCH and texts is not None else k
+    fetch = min(depth * VOTE_OVERSAMPLE if vote_boost > 0 else depth, len(allowed))
+    if fetch <= 0:
+        return [rows[:0] for _ in q_embs]
+    if len(allowed) <= EXACT_SEARCH_LIMIT:
+        # A filtered HNSW walk can dead-end when few nodes pass the filter
+        vectors = index.reconstruct_batch(allowed)
+        all_distances = (
+            (q_embs ** 2).sum(axis=1)[:, None] - 2 * q_embs @ vectors.T + (vectors ** 2).sum(axis=1)[None, :]
+        )
+        order = np.argsort(all_distances, axis=1, kind="stable")[:, :fetch]
+        distances, indices = np.take_along_axis(all_distances, order, axis=1), allowed[order]
     else:
-        filename=Path(templateobject["file"]).stem
-        DATA_FILENEW = os.path.join(SCRIPT_DIR, "MemesRagData", f"{filename}.json")   
-        with open(DATA_FILENEW, "r", encoding="utf-8") as f:
-            datasetnew = json.load(f)
-        documentsnew = [serialize_doc(d,capcount) for d in datasetnew]
-        doc_embeddingsnew = embed_model.encode(documentsnew, convert_to_numpy=True)
-        dimensionnew = doc_embeddingsnew.shape[1]
-        indexnew = faiss.IndexFlatL2(dimensionnew)
-        indexnew.add(doc_embeddingsnew)
-    q_emb = embed_model.encode([query], convert_to_numpy=True)
-    distances, indices = indexnew.search(q_emb, k)
-    results = []
-    for idx in indices[0]:
-        results.append(datasetnew[idx])
-    return results
-
-def searchall(query,capcount:int,k=TOP_K):
-    memes_rag_data_path = os.path.join(SCRIPT_DIR, "MemesRagData")
-    for file in os.listdir(memes_rag_data_path):
-        if file.endswith(".json"):
-            with open(os.path.join(memes_rag_data_path, file), "r", encoding="utf-8") as f:
-                datasetnew = json.load(f)
-                for item in datasetnew:
-                    if "metadata" in item and "img-votes" in item["metadata"]:
-                        item["metadata"]["img-votes"] = int(item["metadata"]["img-votes"])
-                datasetnew.sort(key=lambda x: x["metadata"].get("img-votes", 0), reverse=True)
-                datasetnew.extend(datasetnew[:10])
-    print(len(datasetnew))
-    documentsnew = [serialize_doc(d,capcount) for d in datasetnew]
-    doc_embeddingsnew = embed_model.encode(documentsnew, convert_to_numpy=True)
-    dimensionnew = doc_embeddingsnew.shape[1]
-    indexnew = faiss.IndexFlatL2(dimensionnew)
-    indexnew.add(doc_embeddingsnew) 
-    q_emb = embed_model.encode([query], convert_to_numpy=True)
-    distances, indices = indexnew.search(q_emb, k)
-    results = []
-    for idx in indices[0]:
-        results.append(datasetnew[idx])
-    return results
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=max(HNSW_EF_SEARCH, fetch))
+        distances, indices = index.search(q_embs, fetch, params=params)
+    hits = _rank(distances, indices, rows, depth, vote_boost)
+    box_count = get_corpus().box_count
+    return _hybrid(hits, texts, k, lambda r: box_count[r] == capcount)
+
+def search_template(query, stem: str, capcount: int, k=TOP_K, vote_boost=0.0):
+    return get_docs(_template_hits(embed_query(query), stem, capcount, k, vote_boost, [query])[0])
+
+def search(query, k=TOP_K, vote_boost=0.0):
+    return search_template(query, TEMPLATE_DATA_FILES["Batman Slap"], 2, k, vote_boost)
+
+def search2(query, k=TOP_K, vote_boost=0.0):
+    return search_template(query, TEMPLATE_DATA_FILES["Drake Hotline"], 2, k, vote_boost)
+
+def search3(query, k=TOP_K, vote_boost=0.0):
+    return search_template(query, TEMPLATE_DATA_FILES["Two Buttons"], 3, k, vote_boost)
+
+def searchreusable(query,templateobject,template:str,capcount:int,k=TOP_K,vote_boost=0.0):
+    return search_template(query, template_data_stem(template, templateobject), capcount, k, vote_boost)
+
+def searchall(query,capcount:int,k=TOP_K,vote_boost=VOTE_BOOST):
+    """Search captions of every template that have exactly capcount boxes.
+
+    With vote_boost > 0 a larger candidate set is reranked by
+    distance - vote_boost * log(1 + img-votes) to favor popular memes.
+    With HYBRID_SEARCH the dense hits are fused with BM25 hits on the query.
+    """
+    return get_docs(_global_hits(embed_query(query), capcount, k, vote_boost, [query])[0])
+
+def search_many(queries, template, capcount: int, k=TOP_K, templateobject=None, vote_boost=None):
+    """Retrieve examples for many topics at once.
+
+    All queries are embedded in one batched forward pass and searched with one
+    FAISS call. template=None searches every template like searchall; otherwise
+    it is resolved like searchreusable. vote_boost defaults to the default of
+    that single-query function, so results match it. Returns one result list
+    per query.
+    """
+    queries = list(queries)
+    if not queries:
+        return []
+    q_embs = embed_queries(queries)
+    if template is None:
+        vote_boost = VOTE_BOOST if vote_boost is None else vote_boost
+        hits = _global_hits(q_embs, capcount, k, vote_boost, queries)
+    else:
+        vote_boost = 0.0 if vote_boost is None else vote_boost
+        hits = _template_hits(q_embs, template_data_stem(template, templateobject), capcount, k, vote_boost, queries)
+    return [get_docs(rows) for rows in hits]
 # --------------------------
 # HELPER: FORMAT CONTEXT
 # --------------------------
@@ -167,33 +772,29 @@ def format_context(results):
     return "\n".join(formatted)
 
 def format_context_tr(results):
-    translator = GoogleTranslator(source='auto', target='tr')
+    """format_context with each example's title, author and boxes in Turkish.
 
+    Only the precomputed Turkish RAG corpus (setup/build_turkish_assets.py) is
+    used; strings outside it stay in English, so building a Turkish context
+    never waits on the translator.
+    """
     formatted = []
     for r in results:
-        translated_r = r.copy()
-
-        # translate metadata.title
-        if "metadata" in r and "title" in r["metadata"]:
-            translated_r["metadata"]["title"] = translator.translate(r["metadata"]["title"])
-
-        # translate metadata.author
-        if "metadata" in r and "author" in r["metadata"]:
-            translated_r["metadata"]["author"] = translator.translate(r["metadata"]["author"])
-
-        # translate each box
+        translated_r = dict(r)
+        if "metadata" in r:
+            translated_r["metadata"] = dict(r["metadata"])
+            for field in ("title", "author"):
+                if field in r["metadata"]:
+                    translated_r["metadata"][field] = translate_precomputed(r["metadata"][field], "tr")
         if "boxes" in r:
-            translated_r["boxes"] = [translator.translate(b) for b in r["boxes"]]
-
+            translated_r["boxes"] = [translate_precomputed(b, "tr") for b in r["boxes"]]
         formatted.append(json.dumps(translated_r, ensure_ascii=False))
-
-        output = "\n".join(formatted)
-        return output
+    return "\n".join(formatted)
 
 
 def get_filtered_rag_data(meme_name, max_entries=500):
     """
-    Read RAG data JSON files and return entries where boxes count matches caption count.
+    Read the RAG corpus and return entries where boxes count matches caption count.
     Returns the first max_entries such entries.
     
     Args:
@@ -204,50 +805,18 @@ def get_filtered_rag_data(meme_name, max_entries=500):
         list: List of filtered meme entries
     """
     try:
-        repo_root = os.path.dirname(os.path.abspath(__file__))
-        
-        # Map meme names to their JSON file names
-        meme_file_mapping = {
-            "Two Buttons": "Two-Buttons.json",
-            "Drake Hotline": "Drake-Hotline-Bling.json", 
-            "Batman Slap": "Batman-Slapping-Robin.json",
-            "Uno Card":"UNO-Draw-25-Cards.json",
-            "Road Division": "Left-Exit-12-Off-Ramp.json"
-        }
-        
-        if meme_name not in meme_file_mapping:
+        if meme_name not in TEMPLATE_DATA_FILES:
             print(f"Warning: No RAG data file found for meme '{meme_name}'")
             return []
-        
-        file_path = os.path.join(repo_root, "MemesRagData", meme_file_mapping[meme_name])
-        
-        if not os.path.exists(file_path):
-            print(f"Warning: RAG data file not found: {file_path}")
-            return []
-        
-        # Read the JSON file
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        if not isinstance(data, list):
-            print(f"Warning: Invalid JSON structure in {file_path}")
+
+        stem = TEMPLATE_DATA_FILES[meme_name]
+        if not get_corpus().has_template(stem):
+            print(f"Warning: RAG data not found in corpus: {stem}")
             return []
-        
+
         # Filter entries where boxes count matches expected caption count
-        filtered_entries = []
-        expected_caption_count = get_expected_caption_count(meme_name)
-        
-        for entry in data:
-            if isinstance(entry, dict) and 'boxes' in entry:
-                boxes = entry.get('boxes', [])
-                if isinstance(boxes, list) and len(boxes) == expected_caption_count:
-                    filtered_entries.append(entry)
-                    
-                    # Stop when we reach max_entries
-                    if len(filtered_entries) >= max_entries:
-                        break
-        
-        return filtered_entries
+        rows = template_rows(stem, get_expected_caption_count(meme_name))
+        return get_docs(rows[:max_entries])
         
     except Exception as e:
         print(f"Error reading RAG data for {meme_name}: {str(e)}")
@@ -274,6 +843,17 @@ def get_expected_caption_count(meme_name):
     
     return caption_counts.get(meme_name, 2)
 
+def template_caption_count(stem, templateobject):
+    """Caption count of a dynamic template, or None when its data has no entries."""
+    # Prefer expected length from MongoDB template captions, fallback to dataset heuristic
+    captions_from_mongo = templateobject.get('captions', {}) if isinstance(templateobject, dict) else {}
+    if isinstance(captions_from_mongo, dict) and len(captions_from_mongo) > 0:
+        return len(captions_from_mongo)
+    rows = get_corpus().template_rows(stem)
+    if not len(rows):
+        return None
+    return int(np.bincount(get_corpus().box_count[rows]).argmax())
+
 def get_filtered_rag_data_from_template(templateobject, max_entries=500):
     """
     Load RAG data dynamically using the template object's file reference.
@@ -281,43 +861,77 @@ def get_filtered_rag_data_from_template(templateobject, max_entries=500):
     """
     try:
         filename = Path(templateobject["file"]).stem
-        file_path = os.path.join(SCRIPT_DIR, "MemesRagData", f"{filename}.json")
-        if not os.path.exists(file_path):
-            print(f"Warning: RAG data file not found: {file_path}")
-            return []
-
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        if not isinstance(data, list):
-            print(f"Warning: Invalid JSON structure in {file_path}")
+        corpus = get_corpus()
+        if not corpus.has_template(filename):
+            print(f"Warning: RAG data not found in corpus: {filename}")
             return []
 
-        # Prefer expected length from MongoDB template captions, fallback to dataset heuristic
-        captions_from_mongo = templateobject.get('captions', {}) if isinstance(templateobject, dict) else {}
-        if isinstance(captions_from_mongo, dict) and len(captions_from_mongo) > 0:
-            expected_len = len(captions_from_mongo)
-        else:
-            box_lengths = [len(e.get('boxes', [])) for e in data if isinstance(e, dict) and 'boxes' in e and isinstance(e.get('boxes', []), list)]
-            expected_len = max(set(box_lengths), key=box_lengths.count) if box_lengths else None
-
-        filtered_entries = []
-        for entry in data:
-            if isinstance(entry, dict):
-                boxes = entry.get('boxes', [])
-                if not isinstance(boxes, list):
-                    continue
-                if expected_len is None or len(boxes) == expected_len:
-                    filtered_entries.append(entry)
-                    if len(filtered_entries) >= max_entries:
-                        break
-
-        return filtered_entries
+        rows = template_rows(filename, template_caption_count(filename, templateobject))
+        return get_docs(rows[:max_entries])
     except Exception as e:
         print(f"Error reading dynamic RAG data from template: {str(e)}")
         return []
 
-def get_rag_examples_for_prompt(meme_name,templateobject, max_examples=500):
+# --------------------------
+# FEW-SHOT EXAMPLE POOLS
+# --------------------------
+# Per (template, caption count) list of ready-to-use prompt lines, built offline
+# from the corpus: exact duplicates (case/punctuation-insensitive) collapsed onto
+# their best-voted entry, overlong or blank captions dropped, ranked by votes.
+EXAMPLE_POOL_SIZE = 500  # lines kept per pool
+EXAMPLE_MAX_CHARS = 200  # longest caption set kept as a few-shot example
+FEW_SHOT_EXAMPLES = 40  # lines sampled into each prompt
+
+def _normalize_caption(text):
+    return " ".join("".join(c if c.isalnum() else " " for c in text.lower()).split())
+
+def format_example(boxes):
+    return "- " + " | ".join(f'caption{i}: "{text}"' for i, text in enumerate(boxes, start=1))
+
+def build_example_pool(stem: str, capcount: int):
+    """Build and write the few-shot pool of one template and caption count."""
+    corpus = get_corpus()
+    rows = template_rows(stem, capcount)
+    # Highest votes first, so the first entry seen for a caption is its best-voted copy
+    rows = rows[np.argsort(-np.asarray(corpus.votes[rows]), kind="stable")]
+    seen = set()
+    pool = []
+    for row in rows:
+        boxes = [text.strip() for text in corpus.boxes(row)]
+        if not all(boxes) or sum(len(text) for text in boxes) > EXAMPLE_MAX_CHARS:
+            continue
+        key = tuple(_normalize_caption(text) for text in boxes)
+        if key in seen:
+            continue
+        seen.add(key)
+        pool.append(format_example(boxes))
+        if len(pool) >= EXAMPLE_POOL_SIZE:
+            break
+
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    path = os.path.join(INDEX_DIR, f"{stem}.{capcount}.pool.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(pool, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+    return pool
+
+def _load_example_pool(stem: str, capcount: int):
+    path = os.path.join(INDEX_DIR, f"{stem}.{capcount}.pool.json")
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return build_example_pool(stem, capcount)
+
+def get_example_pool(stem: str, capcount: int):
+    current_manifest()
+    return lazy_resource(("example_pool", stem, capcount), lambda: _load_example_pool(stem, capcount))
+
+def sample_examples(stem: str, capcount: int, n=FEW_SHOT_EXAMPLES):
+    """Return up to n random prompt lines from a template's example pool."""
+    pool = get_example_pool(stem, capcount)
+    return random.sample(pool, min(n, len(pool)))
+
+def get_rag_examples_for_prompt(meme_name,templateobject, max_examples=FEW_SHOT_EXAMPLES):
     """
     Get RAG examples for use in caption generation prompts.
     
@@ -329,35 +943,27 @@ def get_rag_examples_for_prompt(meme_name,templateobject, max_examples=500):
         str: Formatted examples text for prompt
     """
     try:
-        repo_root = os.path.dirname(os.path.abspath(__file__))
-        meme_file_mapping = {
-            "Two Buttons": "Two-Buttons.json",
-            "Drake Hotline": "Drake-Hotline-Bling.json", 
-            "Batman Slap": "Batman-Slapping-Robin.json",
-            "Uno Card":"UNO-Draw-25-Cards.json",
-            "Road Division": "Left-Exit-12-Off-Ramp.json"
-        }
-        named_memes = set(meme_file_mapping.keys())
-    except Exception:
-        named_memes = set()
-
-    if meme_name in named_memes:
-        rag_entries = get_filtered_rag_data(meme_name, max_entries=max_examples)
-    else:
-        rag_entries = get_filtered_rag_data_from_template(templateobject, max_entries=max_examples)
-    # Shuffle in-place without overwriting the list
-    random.shuffle(rag_entries)
-    if not rag_entries:
+        if meme_name in TEMPLATE_DATA_FILES:
+            stem = TEMPLATE_DATA_FILES[meme_name]
+            capcount = get_expected_caption_count(meme_name)
+        else:
+            stem = Path(templateobject["file"]).stem
+            capcount = template_caption_count(stem, templateobject) if get_corpus().has_template(stem) else None
+        if capcount is None or not get_corpus().has_template(stem):
+            print(f"Warning: No RAG examples found for meme '{meme_name}'")
+            return ""
+        return "\n".join(sample_examples(stem, capcount, max_examples))
+    except Exception as e:
+        print(f"Error reading RAG examples for {meme_name}: {str(e)}")
         return ""
-    
-    formatted_examples = []
-    for entry in rag_entries:
-        boxes = entry.get('boxes', [])
-        # Generate formatted examples for caption counts 1 through 5, when available
-        for n in range(1, 6):
-            if len(boxes) >= n:
-                captions_joined = " | ".join(
-                    [f'caption{i}: "{boxes[i-1]}"' for i in range(1, n+1)]
-                )
-                formatted_examples.append(f'- {captions_joined}')
-    return "\n".join(formatted_examples)
\ No newline at end of file
+
+
+if __name__ == "__main__":
+    import sys
+    # setup/build_rag_index.py is the full CLI (--check, --if-stale, --append)
+    if sys.argv[1:] == ["append"]:
+        append_new_data()
+    elif sys.argv[1:]:
+        sys.exit(f"Unknown arguments {sys.argv[1:]}, see python setup/build_rag_index.py --help")
+    else:
+        build_all_indexes()
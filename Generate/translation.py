@@ -0,0 +1,236 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from deep_translator import GoogleTranslator
+
+# --------------------------
+# TRANSLATION CACHE
+# --------------------------
+# Every GoogleTranslator.translate is a network round-trip, yet topics repeat
+# and template explanations never change. translate() answers a
+# (source, target, text) lookup from an in-process LRU, then from a SQLite
+# store shared by all workers on the host that survives restarts, and only
+# calls Google on a miss. Before any of that, strings with a precomputed
+# translation (see PRECOMPUTED) are looked up in memory, and text that langid
+# is confident is already in the target language is returned as is.
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+TRANSLATION_DB = os.environ.get(
+    "TRANSLATION_CACHE_DB", os.path.join(SCRIPT_DIR, "TranslationCache", "translations.sqlite3")
+)
+TRANSLATION_CACHE_SIZE = int(os.environ.get("TRANSLATION_CACHE_SIZE", 4096))  # in-process entries
+# langid probability above which text counts as already being in the target
+# language; short texts ("Elon", "okul") stay well below it and go to Google
+LANGID_MIN_PROB = float(os.environ.get("TRANSLATION_LANGID_MIN_PROB", 0.9))
+
+# Translations generated offline by setup/build_turkish_assets.py, stored next to
+# templatesfront.tr-TR.json: template explanations ({key: {"en": ..., "tr": ...}})
+# and the strings of the most retrievable RAG documents ({english: turkish})
+EXPLANATIONS_TR = os.path.join(SCRIPT_DIR, "explanations.tr-TR.json")
+RAG_CORPUS_TR = os.path.join(SCRIPT_DIR, "ragcorpus.tr-TR.json")
+PRECOMPUTED = {"tr": (EXPLANATIONS_TR, RAG_CORPUS_TR)}
+
+_identifier = None
+_identifier_lock = threading.Lock()
+_precomputed = {}  # target -> (mtimes of its assets, {text: translation})
+
+
+def _asset_mtimes(target):
+    mtimes = []
+    for path in PRECOMPUTED.get(target, ()):
+        try:
+            mtimes.append(os.stat(path).st_mtime_ns)
+        except FileNotFoundError:
+            mtimes.append(None)
+    return tuple(mtimes)
+
+
+def load_precomputed(target):
+    """Return {text: translation} of every precomputed asset for target.
+
+    The tables are reloaded when an asset file appears or changes, so assets
+    built after startup are used without a restart.
+    """
+    mtimes = _asset_mtimes(target)
+    loaded = _precomputed.get(target)
+    if loaded is not None and loaded[0] == mtimes:
+        return loaded[1]
+    table = {}
+    for path in PRECOMPUTED.get(target, ()):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            continue
+        except Exception as e:
+            print(f"Warning: could not load precomputed translations {path}: {str(e)}")
+            continue
+        for key, value in entries.items():
+            if isinstance(value, dict):
+                table[value["en"]] = value[target]
+            else:
+                table[key] = value
+    _precomputed[target] = (mtimes, table)
+    return table
+
+
+def detect_language(text):
+    """Return (language code, probability) of text, detected locally with langid."""
+    global _identifier
+    if _identifier is None:
+        with _identifier_lock:
+            if _identifier is None:
+                # Loading the model takes a few seconds, so it happens on first use
+                from langid.langid import LanguageIdentifier, model
+                _identifier = LanguageIdentifier.from_modelstring(model, norm_probs=True)
+    language, probability = _identifier.classify(text)
+    return language, float(probability)
+
+
+def is_language(text, language):
+    """True when text has nothing to translate into language (no letters, or already in it)."""
+    if not any(c.isalpha() for c in text):
+        return True
+    detected, probability = detect_language(text)
+    return detected == language.split("-")[0].lower() and probability >= LANGID_MIN_PROB
+
+
+class TranslationCache:
+    """Two-level (LRU + SQLite) cache in front of GoogleTranslator, with hit counters."""
+
+    def __init__(self, path, maxsize=4096):
+        self.path = path
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._local = threading.local()
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.store_errors = 0
+        self.identity_skips = 0
+        self.precomputed_hits = 0
+
+    def _connection(self):
+        # sqlite3 connections must not be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                "source TEXT, target TEXT, text TEXT, translated TEXT, PRIMARY KEY (source, target, text))"
+            )
+            self._local.connection = connection
+        return connection
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _load(self, key):
+        try:
+            row = self._connection().execute(
+                "SELECT translated FROM translations WHERE source = ? AND target = ? AND text = ?", key
+            ).fetchone()
+            return row[0] if row else None
+        except Exception as e:
+            # The store is only a cache; fall back to the network
+            print(f"Warning: translation store unavailable: {str(e)}")
+            self.store_errors += 1
+            return None
+
+    def _store(self, key, value):
+        try:
+            connection = self._connection()
+            connection.execute("INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?)", (*key, value))
+            connection.commit()
+        except Exception as e:
+            print(f"Warning: could not persist translation: {str(e)}")
+            self.store_errors += 1
+
+    def get(self, text, target, source="auto"):
+        """Return the cached translation of text, or None."""
+        key = (source, target, text)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return value
+        value = self._load(key)
+        if value is not None:
+            self.store_hits += 1
+            self._remember(key, value)
+        return value
+
+    def put(self, text, target, value, source="auto"):
+        key = (source, target, text)
+        self._remember(key, value)
+        self._store(key, value)
+
+    def precomputed(self, text, target):
+        """Return the precomputed translation of text, or None."""
+        value = load_precomputed(target).get(text)
+        if value is not None:
+            self.precomputed_hits += 1
+        return value
+
+    def translate(self, text, target, source="auto"):
+        """GoogleTranslator(source, target).translate(text), cached."""
+        # Blank text comes back unchanged from Google too
+        if isinstance(text, str) and not text.strip():
+            return text
+        value = self.precomputed(text, target)
+        if value is not None:
+            return value
+        if source == "auto" and isinstance(text, str) and is_language(text, target):
+            self.identity_skips += 1
+            return text
+        value = self.get(text, target, source)
+        if value is not None:
+            return value
+        self.misses += 1
+        value = GoogleTranslator(source=source, target=target).translate(text=text)
+        if value is not None:
+            self.put(text, target, value, source)
+        return value
+
+    def stats(self):
+        lookups = self.memory_hits + self.store_hits + self.misses
+        hits = self.memory_hits + self.store_hits
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "memory_hits": self.memory_hits,
+            "store_hits": self.store_hits,
+            "misses": self.misses,
+            "store_errors": self.store_errors,
+            "identity_skips": self.identity_skips,
+            "precomputed_hits": self.precomputed_hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+translation_cache = TranslationCache(TRANSLATION_DB, TRANSLATION_CACHE_SIZE)
+
+
+def translate(text, target, source="auto"):
+    """Translate text to target through the shared translation cache."""
+    return translation_cache.translate(text, target, source)
+
+
+def translate_precomputed(text, target):
+    """Return the precomputed translation of text, or text itself; never calls the translator."""
+    value = translation_cache.precomputed(text, target)
+    return text if value is None else value
+
+
+def translation_stats():
+    return translation_cache.stats()
@@ -8,6 +8,10 @@ from config import config
 import json
 from werkzeug.utils import secure_filename
 from Generate.Helpers import load_templates
+from Generate.rag import cache_stats
+from Generate.translation import translation_stats
+from Generate.llm import llm_stats
+from Generate.caption_cache import caption_cache_stats
 # Create Blueprint for admin routes
 admin_bp = Blueprint('admin', __name__)
 
@@ -625,3 +629,15 @@ def get_stats(current_user):
     except Exception as e:
         print(f"Error getting stats: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
+
+@admin_bp.route('/cache-stats', methods=['GET'])
+@token_required
+@admin_required
+def get_cache_stats(current_user):
+    """Get hit/miss counters of this worker's in-process caches and LLM calls"""
+    try:
+        return jsonify({'pid': os.getpid(), 'rag': cache_stats(), 'translation': translation_stats(), 'llm': llm_stats(),
+                        'captions': caption_cache_stats()})
+    except Exception as e:
+        print(f"Error getting cache stats: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
@@ -1,12 +1,14 @@
 import random
+import threading
 import traceback
 from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 import json
 import os
-from deep_translator import (GoogleTranslator)
 from datetime import datetime
 from Generate.caption_ai import generate_caption,build_meme_recommender,generate_captions_no_template,generate_shitpost_captions
+from Generate.rag import ensure_artifacts, warm_up
+from Generate.translation import detect_language, translate
 from Generate.ZSC import filter_shitpost_templates_batch
 from Generate.meme_generator import create_meme,create_meme_from_file, describe_image
 from Generate.describe import describe,uploadfile
@@ -39,6 +41,10 @@ CORS(app, resources={r"/*": {"origins": "https://merry-cheesecake-96d2af.netlify
 # Load configuration
 flask_env = os.environ.get('FLASK_ENV', 'default')
 app.config.from_object(config[flask_env])
+ensure_artifacts(app.config['RAG_STALE_ARTIFACTS'])
+if app.config['RAG_WARMUP']:
+    threading.Thread(target=warm_up, daemon=True).start()
+    threading.Thread(target=detect_language, args=("warm up",), daemon=True).start()
 
 CORS(app)  # Enable CORS for React frontend
 
@@ -195,13 +201,12 @@ def generate_meme(current_user):
         templates = load_templates()
         
         if template_key not in templates:
-            template=random.choice(list(templates.values()))
-        else:
-            template = templates[template_key]
-        topiclang=GoogleTranslator(source='auto', target=language).translate(text=topic)
+            template_key=random.choice(list(templates))
+        template = templates[template_key]
+        topiclang=translate(topic, language)
         # Generate captions using your existing AI
         caption_count = len(template.get("captions", {}))
-        captions = generate_caption(topiclang,template, template["tags"], template["name"], num_captions=caption_count,lang=language)
+        captions = generate_caption(topiclang,template, template["tags"], template["name"], num_captions=caption_count,lang=language,template_key=template_key)
         
         # Create the meme using your existing generator
         output_path = create_meme(template, captions)
@@ -434,7 +439,7 @@ def search_templates(current_user):
         
         if not query:
             return jsonify({'error': 'Missing search query'}), 400
-        querylang=GoogleTranslator(source='auto', target="en").translate(text=query)
+        querylang=translate(query, "en")
         templates = load_templates()
         find_memes = build_meme_recommender(templates)
         scored_templates=find_memes(querylang)
@@ -803,7 +808,7 @@ def generate_shitpost(current_user):
         
         # Select template based on style
         if style == 'random':
-            template = random.choice(list(shitpost_friendly_templates.values()))
+            template_key, template = random.choice(list(shitpost_friendly_templates.items()))
         else:
             # Try to find a template that matches the style
             style_keywords = {
@@ -817,22 +822,23 @@ def generate_shitpost(current_user):
             for key, template in shitpost_friendly_templates.items():
                 tags = template.get('tags', [])
                 if any(keyword in tag for keyword in keywords for tag in tags):
-                    matching_templates.append(template)
+                    matching_templates.append((key, template))
             
             if matching_templates:
-                template = random.choice(matching_templates)
+                template_key, template = random.choice(matching_templates)
             else:
-                template = random.choice(list(shitpost_friendly_templates.values()))
+                template_key, template = random.choice(list(shitpost_friendly_templates.items()))
         
         # Translate topic to target language
-        topiclang = GoogleTranslator(source='auto', target=language).translate(text=topic)
+        topiclang = translate(topic, language)
         
         # Generate more chaotic/absurd captions for shitposts
         caption_count = len(template.get("captions", {}))
         
         # Use enhanced caption generation for shitposts
         captions = generate_shitpost_captions(topiclang, template, template["tags"], template["name"], 
-                                            num_captions=caption_count, lang=language, style=style)
+                                            num_captions=caption_count, lang=language, style=style,
+                                            template_key=template_key)
         
         # Create the meme
         output_path = create_meme(template, captions)
@@ -884,8 +890,8 @@ def generate_template_to_meme(current_user):
         link=uploadfile(request.files['image'])
         caption=describe(link)
         caption_count = len(caption_points)
-        topiclang=GoogleTranslator(source='auto', target=language).translate(text=topic)
-        captionlang=GoogleTranslator(source='auto', target=language).translate(text=caption)
+        topiclang=translate(topic, language)
+        captionlang=translate(caption, language)
         captions = generate_captions_no_template(topiclang,captionlang, num_captions=caption_count,lang=language)
         output_path = create_meme_from_file(request.files['image'], captions, caption_points)
         
@@ -958,8 +964,8 @@ def generate_from_user_template(current_user):
         num_captions = len(caption_boxes)
         if num_captions <= 0:
             return jsonify({'error': 'Template has no caption points'}), 400
-        topiclang=GoogleTranslator(source='auto', target=language).translate(text=topic)
-        captionlang=GoogleTranslator(source='auto', target=language).translate(text=blip_caption)
+        topiclang=translate(topic, language)
+        captionlang=translate(blip_caption, language)
         original_template=tmpl.get('original_template','')
         # Generate captions without predefined template metadata
         captions = generate_captions_no_template(topiclang, captionlang, num_captions=num_captions,lang=language,original_template=original_template)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Index-size and retrieval-latency effect of the near-duplicate dedup stage.
+
+For each template/caption-count below, builds a flat index over all rows and
+one over the deduplicated rows (vectors come from the embedding cache) and
+times the same queries against both. Run from the repository root after
+`python -m Generate.rag`:
+
+    python benchmarks/bench_dedup.py [--queries docs]
+
+--queries docs uses cached document vectors as queries, so no embedding
+model is loaded.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Generate import rag  # noqa: E402
+from Generate.dedup import dedup_stats  # noqa: E402
+from bench_retrieval import query_vectors  # noqa: E402
+
+CASES = [("Two-Buttons", 2), ("X-X-Everywhere", 2), ("Ancient-Aliens", 1), ("Left-Exit-12-Off-Ramp", 3)]
+
+
+def flat_index(rows):
+    corpus = rag.get_corpus()
+    vectors = rag.embed_documents([rag.serialize_doc({"boxes": corpus.boxes(r)}, int(corpus.box_count[r])) for r in rows])
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    return index
+
+
+def per_query_ms(index, queries, repeat=20):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for q in queries:
+            index.search(q[None, :], rag.TOP_K)
+        best = min(best, time.perf_counter() - start)
+    return 1000 * best / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index size and latency before and after dedup.")
+    parser.add_argument("--queries", choices=("topics", "docs"), default="topics")
+    args = parser.parse_args()
+
+    corpus = rag.get_corpus()
+    if corpus.canonical is None:
+        sys.exit("No dedup clusters found; run `python -m Generate.rag` first.")
+    stats = dedup_stats(corpus, np.asarray(corpus.canonical))
+    print(
+        f"corpus: {stats['documents']} -> {stats['kept']} documents "
+        f"({stats['removed']} removed), flat vectors "
+        f"{stats['index_bytes_before'] / 2**20:.1f} -> {stats['index_bytes_after'] / 2**20:.1f} MiB"
+    )
+
+    queries = query_vectors(args.queries)
+    for stem, capcount in CASES:
+        all_rows = corpus.template_rows(stem)
+        all_rows = all_rows[corpus.box_count[all_rows] == capcount]
+        kept_rows = rag.template_rows(stem, capcount)
+        before, after = flat_index(all_rows), flat_index(kept_rows)
+        print(
+            f"{stem:>24} ({capcount}): {before.ntotal:6d} -> {after.ntotal:6d} vectors   "
+            f"{per_query_ms(before, queries):.3f} -> {per_query_ms(after, queries):.3f} ms/query"
+        )
+
+
+if __name__ == "__main__":
+    main()
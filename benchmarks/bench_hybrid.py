@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Hybrid (BM25 + dense) vs. dense-only retrieval: added latency and hit quality.
+
+Hit quality is the share of returned captions that mention the topic itself,
+which is what short entity topics ("Elon", "Fauci") need from the context and
+what MiniLM alone tends to miss. Run from the repository root after
+`python setup/build_rag_index.py`:
+
+    python benchmarks/bench_hybrid.py --k 10
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Generate import rag  # noqa: E402
+from Generate.lexical import tokenize  # noqa: E402
+
+TOPICS = [
+    "Elon", "Fauci", "Trump", "Biden", "Covid", "Bitcoin", "Minecraft", "Tesla", "Netflix", "Pikachu",
+    "Fortnite", "Karen", "Thanos", "Zoom", "TikTok", "Shrek", "Kanye", "Obama", "Corona", "Avengers",
+    "monday mornings", "exam week", "working from home", "pineapple pizza", "video game sequels",
+    "cats vs dogs", "group projects", "summer heat", "coffee addiction", "social media",
+]
+
+CASES = [
+    ("Two Buttons", {"file": "Memes/TwoButtons.png"}, 3),
+    ("Drake Hotline", {"file": "Memes/Drake.png"}, 2),
+    (None, None, 2),
+]
+
+
+def run(template, templateobject, capcount, k, hybrid):
+    rag.HYBRID_SEARCH = hybrid
+    results, times = [], []
+    for topic in TOPICS:
+        start = time.perf_counter()
+        if template is None:
+            docs = rag.searchall(topic, capcount, k)
+        else:
+            docs = rag.searchreusable(topic, templateobject, template, capcount, k)
+        times.append(time.perf_counter() - start)
+        results.append(docs)
+    return results, 1000 * np.percentile(times, 50), 1000 * np.percentile(times, 95)
+
+
+def topic_hit_rate(topic, docs):
+    words = set(tokenize(topic))
+    if not docs:
+        return 0.0
+    return sum(bool(words & set(tokenize(" ".join(doc["boxes"])))) for doc in docs) / len(docs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--k", type=int, default=rag.TOP_K)
+    args = parser.parse_args()
+
+    # Load everything and fill the query cache so both passes time retrieval only
+    rag.warm_up()
+    rag.get_lexical_index()
+    rag.embed_queries(TOPICS)
+
+    print(f"{len(TOPICS)} topics, k={args.k}")
+    print(f"{'case':>16} {'mode':>7} {'p50 ms':>7} {'p95 ms':>7} {'topic hits':>10} {'entity hits':>11}")
+    for template, templateobject, capcount in CASES:
+        name = f"{template or 'all'} ({capcount})"
+        for hybrid in (False, True):
+            results, p50, p95 = run(template, templateobject, capcount, args.k, hybrid)
+            rates = [topic_hit_rate(topic, docs) for topic, docs in zip(TOPICS, results)]
+            print(
+                f"{name:>16} {'hybrid' if hybrid else 'dense':>7} {p50:7.3f} {p95:7.3f} "
+                f"{np.mean(rates):10.3f} {np.mean(rates[:20]):11.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for Generate.rag.
+
+Measures, in fresh interpreters, how long `import Generate.rag` takes and how
+long the first retrieval takes afterwards (model + corpus + index loading).
+Run it from the repository root on two checkouts to compare before/after:
+
+    python benchmarks/bench_import.py --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+t0 = time.perf_counter()
+import Generate.rag as rag
+t1 = time.perf_counter()
+rag.searchall("monday mornings", 2)
+t2 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "first_search": t2 - t1}))
+"""
+
+
+def run_probe():
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    # Warnings printed by rag.py come first; the timings are on the last line
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="number of fresh interpreters to time")
+    args = parser.parse_args()
+
+    samples = [run_probe() for _ in range(args.runs)]
+    for key in ("import", "first_search"):
+        values = [s[key] for s in samples]
+        print(f"{key:>12}: median {statistics.median(values):.3f}s  min {min(values):.3f}s  max {max(values):.3f}s")
+
+
+if __name__ == "__main__":
+    main()
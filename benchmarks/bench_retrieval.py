@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Retrieval benchmark: build time, memory, recall@k and latency percentiles
+of every index type rag.py supports.
+
+Each fixed template case is indexed with every INDEX_TYPES storage (as the
+per-template indexes are), and the global case with every storage under HNSW
+searched through the box-count filter (as searchall does). Ground truth is an
+exact float32 search over the same vectors. Document vectors come from the
+embedding cache, so after `python setup/build_rag_index.py` this runs offline
+on CPU; --queries docs also avoids loading the embedding model for queries.
+
+    python benchmarks/bench_retrieval.py --k 10
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Generate import rag  # noqa: E402
+from bench_search_many import TOPICS  # noqa: E402
+
+TEMPLATE_CASES = [("Two-Buttons", 3), ("Drake-Hotline-Bling", 2), ("Ancient-Aliens", 1), ("Left-Exit-12-Off-Ramp", 3)]
+GLOBAL_CAPCOUNT = 2
+SEED = 0
+
+
+def document_vectors(rows, capcount=None):
+    corpus = rag.get_corpus()
+    return rag.embed_documents([
+        rag.serialize_doc({"boxes": corpus.boxes(r)}, capcount or int(corpus.box_count[r])) for r in rows
+    ])
+
+
+def query_vectors(kind):
+    if kind == "topics":
+        return rag.embed_queries(TOPICS)
+    # Fixed random documents stand in for topics when the model is unavailable
+    corpus = rag.get_corpus()
+    rows = np.flatnonzero(np.asarray(corpus.box_count) > 0)
+    return document_vectors(np.random.default_rng(SEED).choice(rows, len(TOPICS), replace=False))
+
+
+def measure(index, queries, truth, k, repeat, params=None):
+    _, found = index.search(queries, k, params=params)
+    recall = np.mean([len(np.intersect1d(f[f >= 0], t)) / len(t) for f, t in zip(found, truth)])
+    times = []
+    for _ in range(repeat):
+        for q in queries:
+            start = time.perf_counter()
+            index.search(q[None, :], k, params=params)
+            times.append(time.perf_counter() - start)
+    p50, p95, p99 = 1000 * np.percentile(times, [50, 95, 99])
+    return recall, p50, p95, p99
+
+
+def report(name, index_type, build, index, result):
+    size = len(faiss.serialize_index(index)) / 2**20
+    recall, p50, p95, p99 = result
+    # Small sets fall back to another storage, so show what was actually built
+    built = type(index).__name__
+    print(f"{name:>28} {index_type:>9} {built:>20} {build:8.2f} {size:8.1f} {recall:7.3f} {p50:7.3f} {p95:7.3f} {p99:7.3f}")
+
+
+def exact_truth(vectors, queries, k, subset=None):
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors if subset is None else vectors[subset])
+    _, truth = exact.search(queries, k)
+    return truth if subset is None else subset[truth]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--k", type=int, default=rag.TOP_K)
+    parser.add_argument("--queries", choices=("topics", "docs"), default="topics")
+    parser.add_argument("--repeat", type=int, default=5, help="timed passes over the queries")
+    parser.add_argument("--global-limit", type=int, default=50000, help="documents in the global case (0 = all)")
+    args = parser.parse_args()
+
+    queries = query_vectors(args.queries)
+    print(f"{len(queries)} {args.queries} queries, k={args.k}, {args.repeat} timed passes")
+    print(f"{'case':>28} {'type':>9} {'faiss index':>20} {'build s':>8} {'MiB':>8} {'recall':>7} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7}")
+
+    for stem, capcount in TEMPLATE_CASES:
+        vectors = document_vectors(rag.template_rows(stem, capcount), capcount)
+        truth = exact_truth(vectors, queries, args.k)
+        for index_type in rag.INDEX_TYPES:
+            start = time.perf_counter()
+            index = rag.make_index(vectors, index_type)
+            build = time.perf_counter() - start
+            report(f"{stem} ({capcount})", index_type, build, index, measure(index, queries, truth, args.k, args.repeat))
+
+    corpus = rag.get_corpus()
+    rows = np.flatnonzero(np.asarray(corpus.box_count) > 0)
+    rows = rows[corpus.is_representative(rows)]
+    if args.global_limit:
+        rows = np.sort(np.random.default_rng(SEED).choice(rows, min(args.global_limit, len(rows)), replace=False))
+    vectors = document_vectors(rows)
+    allowed = np.flatnonzero(corpus.box_count[rows] == GLOBAL_CAPCOUNT).astype(np.int64)
+    truth = exact_truth(vectors, queries, args.k, allowed)
+    for index_type in rag.INDEX_TYPES:
+        start = time.perf_counter()
+        index = rag.make_index(vectors, index_type, hnsw=True)
+        build = time.perf_counter() - start
+        params = faiss.SearchParametersHNSW(sel=faiss.IDSelectorBatch(allowed), efSearch=rag.HNSW_EF_SEARCH)
+        result = measure(index, queries, truth, args.k, args.repeat, params)
+        report(f"global {len(rows)} ({GLOBAL_CAPCOUNT})", "hnsw+" + index_type, build, index, result)
+
+
+if __name__ == "__main__":
+    main()
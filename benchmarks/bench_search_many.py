@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark: rag.search_many vs. one searchreusable/searchall call per topic.
+
+The query embedding cache is cleared before every pass so both sides pay for
+encoding. Run from the repository root after building the indexes:
+
+    python -m Generate.rag
+    python benchmarks/bench_search_many.py --repeat 3
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Generate import rag  # noqa: E402
+
+TOPICS = [
+    "monday mornings", "exam week", "online classes", "working from home", "crypto crash",
+    "gym on january first", "pineapple pizza", "video game sequels", "elon musk", "cats vs dogs",
+    "dentist appointments", "group projects", "netflix prices", "summer heat", "coffee addiction",
+    "traffic jams", "social media", "diet plans", "new iphone", "sleep schedule",
+    "taxes", "wifi password", "zoom meetings", "weekend plans", "spoilers",
+    "self checkout", "leftover pizza", "alarm clocks", "rainy days", "phone battery",
+    "inflation", "flat earth", "ai art", "job interviews", "homework deadlines",
+    "fast food", "road trips", "winter is coming", "vaccines", "tiktok dances",
+    "procrastination", "birthday parties", "customer service", "printer errors", "football finals",
+    "meal prep", "black friday", "moving apartments", "software updates", "first day at work",
+    "hot sauce", "airport security", "lost keys", "group chats", "thanksgiving dinner",
+    "online shopping", "sunday scaries", "marathon training", "streaming services", "bad wifi",
+    "power outage", "smart fridges", "memes about memes", "book clubs",
+]
+
+CASES = [
+    ("Two Buttons", {"file": "Memes/TwoButtons.png"}, 3),
+    ("Drake Hotline", {"file": "Memes/Drake.png"}, 2),
+    (None, None, 2),
+]
+
+
+def loop(topics, template, templateobject, capcount, k, vote_boost):
+    if template is None:
+        return [rag.searchall(topic, capcount, k, vote_boost=vote_boost) for topic in topics]
+    return [rag.searchreusable(topic, templateobject, template, capcount, k, vote_boost=vote_boost) for topic in topics]
+
+
+def timed(fn, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        rag.query_cache = rag.QueryEmbeddingCache(rag.QUERY_CACHE_SIZE, rag.QUERY_CACHE_TTL)
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="passes per measurement (best is reported)")
+    parser.add_argument("--k", type=int, default=rag.TOP_K)
+    parser.add_argument("--vote-boost", type=float, default=rag.VOTE_BOOST,
+                        help="vote prior weight, passed to both sides so they run the same search")
+    args = parser.parse_args()
+
+    rag.warm_up()
+    n = len(TOPICS)
+    for template, templateobject, capcount in CASES:
+        looped = timed(loop, TOPICS, template, templateobject, capcount, args.k, args.vote_boost, repeat=args.repeat)
+        batched = timed(
+            lambda: rag.search_many(
+                TOPICS, template, capcount, args.k, templateobject=templateobject, vote_boost=args.vote_boost
+            ),
+            repeat=args.repeat,
+        )
+        name = template or "all templates"
+        print(
+            f"{name:>15} ({capcount} captions): loop {n / looped:8.1f} q/s   "
+            f"search_many {n / batched:8.1f} q/s   speedup x{looped / batched:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Memory per worker with and without memory-mapped RAG indexes.
+
+Starts --workers processes like gunicorn workers. Each one loads the corpus,
+the global, lexical and every template index, then searches them with random
+vectors so every page is touched. While all of them are alive, it reports
+RSS, anonymous (private) RSS and PSS, which splits shared pages between the
+processes that map them. Run from the repository root after
+`python setup/build_rag_index.py`:
+
+    python benchmarks/bench_worker_rss.py --workers 2
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def memory():
+    """RSS, RssAnon and PSS of this process in MiB."""
+    fields = {}
+    for path, keys in (("/proc/self/status", ("VmRSS", "RssAnon")), ("/proc/self/smaps_rollup", ("Pss",))):
+        with open(path) as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in keys:
+                    fields[key] = int(value.split()[0]) / 1024
+    return fields
+
+
+def worker():
+    # Keep stdout for the report; rag logs with print()
+    report, sys.stdout = sys.stdout, sys.stderr
+    sys.path.insert(0, ROOT)
+    from Generate import rag
+
+    before = memory()["VmRSS"]
+    corpus = rag.get_corpus()
+    indexes = [rag.get_global_index()]
+    for stem in corpus.templates:
+        for capcount in range(1, rag.MAX_CAPTIONS + 1):
+            indexes.append(rag.get_template_index(stem, capcount))
+    queries = np.random.default_rng(0).random((4, indexes[0][0].d), dtype=np.float32)
+    for index, rows in indexes:
+        if index.ntotal:
+            index.search(queries, rag.TOP_K)
+            rows.sum()
+    if rag.HYBRID_SEARCH:
+        lexical = rag.get_lexical_index()
+        for array in (lexical.indptr, lexical.rows, lexical.weights):
+            array.sum()
+    print(json.dumps({"baseline": before, **memory()}), file=report, flush=True)
+    sys.stdin.readline()  # stay alive until every worker has reported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        return worker()
+
+    print(f"{'mmap':>5} {'worker':>6} {'RSS MiB':>8} {'anon MiB':>9} {'PSS MiB':>8}")
+    for mmap in ("false", "true"):
+        env = {**os.environ, "RAG_INDEX_MMAP": mmap}
+        procs = [
+            subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "--worker"],
+                env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+            )
+            for _ in range(args.workers)
+        ]
+        reports = [json.loads(proc.stdout.readline()) for proc in procs]
+        for proc in procs:
+            proc.communicate("\n")
+        for i, report in enumerate(reports):
+            # Subtract the interpreter and imports, which are not index memory
+            print(
+                f"{mmap:>5} {i:>6} {report['VmRSS'] - report['baseline']:8.1f} "
+                f"{report['RssAnon']:9.1f} {report['Pss']:8.1f}"
+            )
+        print(f"{mmap:>5} {'total':>6} {'':>8} {sum(r['RssAnon'] for r in reports):9.1f} {sum(r['Pss'] for r in reports):8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -23,6 +23,15 @@ class Config:
     API_TIMEOUT = 30  # seconds
     MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
 
+    # Load the RAG model, indexes and language detector in the background at boot instead of on the first request
+    RAG_WARMUP = os.environ.get('RAG_WARMUP', 'false').lower() == 'true'
+    # What to do at boot when Generate/RagIndex is missing or does not match the
+    # code or data: 'warn', 'refuse' to start, or 'rebuild'. Build the artifacts
+    # ahead of time with python setup/build_rag_index.py (the Docker image does);
+    # a full build takes minutes, so with 'warn' the first searches would run it
+    # inside a request, and 'rebuild' needs a gunicorn --timeout that long
+    RAG_STALE_ARTIFACTS = os.environ.get('RAG_STALE_ARTIFACTS', 'warn').lower()
+
 class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
@@ -35,6 +44,8 @@ class ProductionConfig(Config):
     SECRET_KEY = os.environ.get('SECRET_KEY','V~DoV0Q!=3C:+AF')
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY','q=?-B79D*knuoBc')
     MONGODB_URI = os.environ.get('MONGODB_URI')
+    # Never serve while building indexes inside requests
+    RAG_STALE_ARTIFACTS = os.environ.get('RAG_STALE_ARTIFACTS', 'refuse').lower()
 
 class TestingConfig(Config):
     """Testing configuration"""
@@ -141,7 +141,8 @@ def reddit_get():
             template_tags=template_tags,
             meme_name=meme_name,
             num_captions=caption_count,
-            lang="en"
+            lang="en",
+            template_key=best_label
         )
 
         # Add to response
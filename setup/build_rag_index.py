@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+RAG Index Build Script for AI Meme Generator
+Builds the retrieval corpus, document embedding cache, template and global
+indexes and few-shot example pools ahead of deploy, and records what they were
+built from in Generate/RagIndex/manifest.json.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Generate import rag  # noqa: E402
+
+
+def print_manifest(manifest):
+    print(f"   version:   {manifest['version']}")
+    print(f"   format:    {manifest.get('format_version')}")
+    print(f"   model:     {manifest.get('model')}")
+    print(f"   indexes:   {manifest.get('index_types')}")
+    print(f"   documents: {manifest['documents']}")
+    for stage, seconds in manifest.get("timings", {}).items():
+        print(f"   {stage + ':':<18} {seconds:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the RAG retrieval artifacts offline.")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--check", action="store_true", help="only report whether the artifacts are stale (exit code 1 if so)")
+    mode.add_argument("--if-stale", action="store_true", help="build only when the artifacts are stale")
+    mode.add_argument("--append", action="store_true", help="add new MemesRagData entries to the existing indexes")
+    args = parser.parse_args()
+
+    print("🚀 RAG Index Build for AI Meme Generator")
+    print("=" * 60)
+
+    if args.append:
+        manifest = rag.append_new_data()
+        print("✅ RAG artifacts updated!")
+        print_manifest(manifest)
+        return 0
+
+    reasons = rag.stale_reasons()
+    for reason in reasons:
+        print(f"⚠️  {reason}")
+    if args.check or (args.if_stale and not reasons):
+        print("❌ RAG artifacts are stale" if reasons else "✅ RAG artifacts are up to date")
+        return 1 if reasons else 0
+
+    manifest = rag.build_all_indexes()
+    print("✅ RAG artifacts built successfully!")
+    print_manifest(manifest)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Turkish Asset Build Script for AI Meme Generator
+Translates template explanations and the most retrievable RAG documents to
+Turkish once, offline, so Turkish requests look them up instead of calling
+Google Translate. The output sits next to Generate/templatesfront.tr-TR.json:
+    Generate/explanations.tr-TR.json   {template key: {"en": ..., "tr": ...}}
+    Generate/ragcorpus.tr-TR.json      {english string: turkish string}
+Existing entries are kept, so reruns only translate what is new.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Generate import rag  # noqa: E402
+from Generate.Helpers import load_templates  # noqa: E402
+from Generate.translation import EXPLANATIONS_TR, RAG_CORPUS_TR, translation_cache  # noqa: E402
+
+
+def read_json(path):
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def write_json(path, data):
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def to_turkish(text):
+    # source="en" bypasses the language-detection shortcut, which would keep
+    # short English strings that langid happens to read as Turkish
+    return translation_cache.translate(text, "tr", source="en")
+
+
+def build_explanations():
+    explanations = read_json(EXPLANATIONS_TR)
+    templates = load_templates()
+    translated = 0
+    for key, template in templates.items():
+        explanation = template.get("explanation", "")
+        if not explanation or explanations.get(key, {}).get("en") == explanation:
+            continue
+        explanations[key] = {"en": explanation, "tr": to_turkish(explanation)}
+        translated += 1
+    write_json(EXPLANATIONS_TR, explanations)
+    print(f"✅ {translated} template explanations translated, {len(explanations)} stored")
+
+
+def corpus_strings(per_template):
+    """Titles, authors and boxes of the highest-voted documents of each template."""
+    corpus = rag.get_corpus()
+    strings = set()
+    for stem in corpus.templates:
+        rows = rag.template_rows(stem)
+        rows = rows[np.argsort(-np.asarray(corpus.votes[rows]), kind="stable")[:per_template]]
+        for doc in rag.get_docs(rows):
+            strings.update([doc["metadata"]["title"], doc["metadata"]["author"], *doc["boxes"]])
+    return sorted(text for text in strings if text.strip())
+
+
+def build_corpus(per_template):
+    corpus = read_json(RAG_CORPUS_TR)
+    missing = [text for text in corpus_strings(per_template) if text not in corpus]
+    print(f"Translating {len(missing)} RAG strings...")
+    for i, text in enumerate(missing, start=1):
+        try:
+            corpus[text] = to_turkish(text)
+        except Exception as e:
+            print(f"⚠️  Could not translate {text!r}: {e}")
+        if i % 500 == 0:
+            # Save progress, a long run may hit rate limits
+            write_json(RAG_CORPUS_TR, corpus)
+            print(f"   {i}/{len(missing)}")
+    write_json(RAG_CORPUS_TR, corpus)
+    print(f"✅ {len(corpus)} Turkish RAG strings stored")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute Turkish template explanations and RAG corpus.")
+    parser.add_argument("--per-template", type=int, default=300,
+                        help="highest-voted documents per template to translate")
+    parser.add_argument("--skip-corpus", action="store_true", help="only translate template explanations")
+    args = parser.parse_args()
+
+    print("🚀 Turkish Asset Build for AI Meme Generator")
+    print("=" * 60)
+    build_explanations()
+    if not args.skip_corpus:
+        build_corpus(args.per_template)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+from Generate import caption_ai, caption_cache
+from Generate.caption_cache import CaptionCache
+from Generate.llm import LLM_ATTEMPT_TIMEOUT, LLM_DEADLINE, LLMGateway
+from Generate.Models import MemeCaption2
+
+
+def test_one_sets_reply_serves_the_rotation(monkeypatch):
+    monkeypatch.setattr(caption_cache, "caption_cache", CaptionCache(variants=3))
+    monkeypatch.setattr(caption_cache, "CAPTION_SEMANTIC_CACHE", False)
+    calls = []
+
+    def parse(messages, response_model, temperature, deadline=None, attempt_timeout=None):
+        calls.append(attempt_timeout)
+        return response_model(sets=[MemeCaption2(caption1=f"s{i}", caption2="b") for i in range(3)])
+
+    monkeypatch.setattr(caption_ai.llm, "parse", parse)
+    messages = [{"role": "user", "content": "captions about mondays"}]
+
+    def generate(sets):
+        return caption_ai.request_caption_sets(messages, 2, 0.6, sets=sets)
+
+    served = [caption_cache.cached_captions(("drake", "mondays", "en", "template", 2), generate)[0] for _ in range(4)]
+    assert served == ["s0", "s1", "s2", "s0"]
+    assert calls == [3 * LLM_ATTEMPT_TIMEOUT]
+
+
+def test_attempt_timeout_override_is_bounded_by_the_deadline():
+    gateway = LLMGateway("http://localhost", "key", "model")
+    assert gateway._call(lambda timeout: timeout) == LLM_ATTEMPT_TIMEOUT
+    assert gateway._call(lambda timeout: timeout, attempt_timeout=3 * LLM_ATTEMPT_TIMEOUT) <= LLM_DEADLINE
+    assert gateway._call(lambda timeout: timeout, attempt_timeout=LLM_ATTEMPT_TIMEOUT / 3) == LLM_ATTEMPT_TIMEOUT / 3
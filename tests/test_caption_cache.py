@@ -0,0 +1,78 @@
+import threading
+import time
+
+from Generate.caption_cache import CaptionCache, SingleFlight, caption_key, template_id
+
+
+def test_sets_of_one_generation_are_served_in_turn():
+    cache = CaptionCache(variants=3)
+    cache.add("k", [["A"], ["B"], ["C"]])  # the generating request returned A
+    assert [cache.get("k")[0] for _ in range(4)] == ["B", "C", "A", "B"]
+
+
+def test_fill_continues_after_the_set_it_returned():
+    cache = CaptionCache(variants=3)
+    cache.add("k", [["A"]])
+    assert cache.get("k") is None
+    cache.add("k", [["B"], ["C"]])  # the filling request returned B
+    assert [cache.get("k")[0] for _ in range(3)] == ["C", "A", "B"]
+
+
+def test_single_flight_shares_one_call():
+    flight = SingleFlight(wait=5)
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def generate():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return ["shared"]
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", generate)))
+    leader.start()
+    assert started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(flight.do("k", generate)))
+    follower.start()
+    while flight.coalesced == 0:
+        time.sleep(0.01)
+    release.set()
+    leader.join()
+    follower.join()
+    assert results == [["shared"], ["shared"]]
+    assert len(calls) == 1
+    assert (flight.shared, flight.timeouts) == (1, 0)
+
+
+def test_single_flight_follower_stops_waiting():
+    flight = SingleFlight(wait=0.05)
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return ["leader"]
+
+    leader = threading.Thread(target=flight.do, args=("k", slow))
+    leader.start()
+    assert started.wait(5)
+    try:
+        assert flight.do("k", lambda: ["own"]) == ["own"]
+    finally:
+        release.set()
+        leader.join()
+    assert (flight.shared, flight.timeouts) == (0, 1)
+
+
+def test_template_identity_follows_key_and_prompt_fields():
+    drake = {"name": "Drake", "file": "Memes/Drake.png", "captions": {"caption1": {}, "caption2": {}},
+             "explanation": "reject, then approve", "tags": ["choice"]}
+    same_name = {**drake, "file": "Memes/Drake2.png"}
+    edited = {**drake, "explanation": "approve, then reject"}
+    retagged = {**drake, "tags": ["preference"]}
+    assert template_id("drake", drake) != template_id("drake_copy", same_name)
+    assert template_id("drake", drake) != template_id("drake", edited)
+    assert template_id("drake", drake) == template_id("drake", retagged)
+    assert caption_key(template_id("drake", drake), "Mondays!", "en", "template", 2) == \
+        caption_key(template_id("drake", retagged), " mondays", "en", "template", 2)
@@ -0,0 +1,61 @@
+import json
+
+import numpy as np
+
+from Generate.corpus_store import CorpusStore, append_corpus, build_corpus
+from Generate.dedup import dedup_appended, dedup_corpus
+
+
+def _entry(boxes, votes):
+    return {"metadata": {"title": "t", "author": "a", "img-votes": str(votes), "views": "1"}, "boxes": boxes}
+
+
+def _write(data_dir, entries):
+    with open(data_dir / "Two-Buttons.json", "w", encoding="utf-8") as f:
+        json.dump(entries, f)
+
+
+def test_appended_duplicate_keeps_indexed_representative(tmp_path):
+    data_dir, out_dir = tmp_path / "data", tmp_path / "index"
+    data_dir.mkdir()
+    entries = [
+        _entry(["cats are better than dogs", "change my mind"], 10),
+        _entry(["pineapple on pizza", "is a crime"], 5),
+    ]
+    _write(data_dir, entries)
+    build_corpus(str(data_dir), str(out_dir))
+    dedup_corpus(str(out_dir))
+
+    # A repost with more votes than the indexed original
+    _write(data_dir, entries + [_entry(["cats are better than dogs", "change my mind"], 500)])
+    new_rows = append_corpus(str(data_dir), str(out_dir))
+    representatives = dedup_appended(str(out_dir), new_rows)
+
+    corpus = CorpusStore(str(out_dir))
+    assert new_rows.tolist() == [2]
+    assert len(representatives) == 0
+    assert np.asarray(corpus.canonical).tolist() == [0, 1, 0]
+
+
+def test_reposts_collapse_onto_the_highest_voted_copy(tmp_path):
+    data_dir, out_dir = tmp_path / "data", tmp_path / "index"
+    data_dir.mkdir()
+    _write(data_dir, [
+        _entry(["cats are better than dogs", "change my mind"], 10),
+        _entry(["Cats are better than dogs!", "Change my mind."], 50),
+        _entry(["pineapple on pizza", "is a crime"], 5),
+        _entry(["cats are better than dogs", "change my mind", "fight me"], 1),
+    ])
+    with open(data_dir / "Drake-Hotline-Bling.json", "w", encoding="utf-8") as f:
+        json.dump([_entry(["cats are better than dogs", "change my mind"], 100)], f)
+    build_corpus(str(data_dir), str(out_dir))
+    stats = dedup_corpus(str(out_dir))
+
+    corpus = CorpusStore(str(out_dir))
+    two_buttons = corpus.template_rows("Two-Buttons").tolist()
+    drake = corpus.template_rows("Drake-Hotline-Bling").tolist()
+    canonical = np.asarray(corpus.canonical)
+    # Only the two copies of the same template and box count are merged
+    assert canonical[two_buttons].tolist() == [two_buttons[1], two_buttons[1], two_buttons[2], two_buttons[3]]
+    assert canonical[drake].tolist() == drake
+    assert stats["removed"] == 1
@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from Generate import rag
+from Generate.corpus_store import build_corpus
+
+
+@pytest.fixture
+def artifacts(monkeypatch, tmp_path):
+    data_dir, index_dir = tmp_path / "data", tmp_path / "index"
+    data_dir.mkdir()
+    with open(data_dir / "Two-Buttons.json", "w", encoding="utf-8") as f:
+        json.dump([{"metadata": {"img-votes": "3"}, "boxes": ["red button", "blue button", "me"]}], f)
+    monkeypatch.setattr(rag, "DATA_DIR", str(data_dir))
+    monkeypatch.setattr(rag, "INDEX_DIR", str(index_dir))
+    monkeypatch.setattr(rag, "MANIFEST_FILE", str(index_dir / "manifest.json"))
+    build_corpus(str(data_dir), str(index_dir))
+    rag.write_manifest({"version": 1, "documents": 1, "indexes": {}, **rag._build_info()})
+    return data_dir
+
+
+def test_fresh_manifest_only_reports_missing_indexes(artifacts):
+    reasons = rag.stale_reasons(capcounts=())
+    assert len(reasons) == 1 and "indexes missing" in reasons[0]
+
+
+def test_older_artifact_format_is_stale(artifacts):
+    rag.write_manifest({**rag.read_manifest(), "format_version": rag.ARTIFACT_FORMAT - 1})
+    assert any("artifact format" in reason for reason in rag.stale_reasons(capcounts=()))
+    with pytest.raises(RuntimeError):
+        rag.append_new_data()
+
+
+def test_changed_data_is_stale(artifacts):
+    with open(artifacts / "Two-Buttons.json", "w", encoding="utf-8") as f:
+        json.dump([], f)
+    assert any("Two-Buttons" in reason for reason in rag.stale_reasons(capcounts=()))
@@ -0,0 +1,52 @@
+import threading
+
+import numpy as np
+
+from Generate import rag
+
+
+def test_slow_load_does_not_block_other_resources():
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "slow"
+
+    loader = threading.Thread(target=rag.lazy_resource, args=(("test", "slow"), slow))
+    loader.start()
+    try:
+        assert started.wait(5)
+        assert rag.lazy_resource(("test", "fast"), lambda: "fast") == "fast"
+        assert loader.is_alive()
+    finally:
+        release.set()
+        loader.join()
+    assert rag.lazy_resource(("test", "slow"), lambda: "reloaded") == "slow"
+    rag.reset_resources()
+
+
+def test_load_racing_a_reset_is_not_kept():
+    def load():
+        rag.reset_resources()  # the manifest changed while this resource loaded
+        return "old"
+
+    assert rag.lazy_resource(("test", "raced"), load) == "old"
+    assert rag.lazy_resource(("test", "raced"), lambda: "new") == "new"
+    rag.reset_resources()
+
+
+class _FakeModel:
+    def encode(self, texts, convert_to_numpy=True):
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+
+def test_template_descriptions_skip_the_corpus_embedding_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(rag, "TEMPLATE_EMBED_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(rag, "get_embed_model", _FakeModel)
+    rag.reset_resources()
+    vectors = rag.embed_template_descriptions(["drake likes", "two buttons"])
+    assert vectors.tolist() == [[11.0, 1.0], [11.0, 1.0]]
+    assert "template_embedding_cache" in rag._resources
+    assert "embedding_cache" not in rag._resources
+    rag.reset_resources()
@@ -0,0 +1,50 @@
+import json
+
+import faiss
+import numpy as np
+
+from Generate import rag
+from Generate.corpus_store import CorpusStore, build_corpus
+from Generate.lexical import LexicalIndex
+
+
+def _empty_partition(stem, capcount):
+    return faiss.IndexFlatL2(384), np.zeros(0, dtype=np.int64)
+
+
+def test_rank_empty_rows_with_vote_boost():
+    distances = np.full((2, 3), np.inf, dtype=np.float32)
+    indices = np.full((2, 3), -1, dtype=np.int64)
+    hits = rag._rank(distances, indices, np.zeros(0, dtype=np.int64), 3, vote_boost=0.01)
+    assert [len(h) for h in hits] == [0, 0]
+
+
+def test_template_hits_empty_partition_with_vote_boost(monkeypatch):
+    monkeypatch.setattr(rag, "get_template_index", _empty_partition)
+    q_embs = np.random.default_rng(0).standard_normal((2, 384)).astype(np.float32)
+    for texts in (None, ["monday mornings", "cats"]):
+        hits = rag._template_hits(q_embs, "Empty-Template", 7, k=5, vote_boost=0.01, texts=texts)
+        assert [len(h) for h in hits] == [0, 0]
+
+
+def test_fuse_ranks_rows_found_by_both_searches_first():
+    dense, lexical = np.array([1, 2, 3]), np.array([3, 4])
+    assert rag._fuse(dense, lexical, 4).tolist() == [3, 1, 2, 4]
+    assert rag._fuse(dense, np.zeros(0, dtype=np.int64), 2).tolist() == [1, 2]
+
+
+def test_lexical_index_finds_rare_terms(tmp_path):
+    data_dir, out_dir = tmp_path / "data", tmp_path / "index"
+    data_dir.mkdir()
+    boxes = [["elon buys twitter", "again"], ["monday mornings", "coffee"], ["elon", "mars"]]
+    with open(data_dir / "Two-Buttons.json", "w", encoding="utf-8") as f:
+        json.dump([{"metadata": {"img-votes": "1"}, "boxes": b} for b in boxes], f)
+    build_corpus(str(data_dir), str(out_dir))
+    corpus = CorpusStore(str(out_dir))
+    index = LexicalIndex.build(corpus, np.arange(len(corpus)))
+    index.save(str(out_dir / "lexical"))
+    index = LexicalIndex.load(str(out_dir / "lexical"))
+    # The shorter document matching "elon" scores higher
+    assert index.search("Elon", 5).tolist() == [2, 0]
+    assert index.search("Elon", 5, accept=lambda rows: rows != 2).tolist() == [0]
+    assert index.search("unrelated words", 5).tolist() == []
@@ -0,0 +1,58 @@
+import json
+
+from Generate import rag, translation
+
+
+def test_precomputed_assets_built_after_startup_are_loaded(monkeypatch, tmp_path):
+    asset = tmp_path / "ragcorpus.tr-TR.json"
+    monkeypatch.setattr(translation, "PRECOMPUTED", {"tr": (str(asset),)})
+    monkeypatch.setattr(translation, "_precomputed", {})
+    assert translation.load_precomputed("tr") == {}
+    with open(asset, "w", encoding="utf-8") as f:
+        json.dump({"change my mind": "fikrimi değiştir"}, f)
+    assert translation.load_precomputed("tr") == {"change my mind": "fikrimi değiştir"}
+
+
+def test_turkish_context_uses_only_precomputed_strings(monkeypatch, tmp_path):
+    asset = tmp_path / "ragcorpus.tr-TR.json"
+    with open(asset, "w", encoding="utf-8") as f:
+        json.dump({"change my mind": "fikrimi değiştir"}, f)
+    monkeypatch.setattr(translation, "PRECOMPUTED", {"tr": (str(asset),)})
+    monkeypatch.setattr(translation, "_precomputed", {})
+
+    def offline(*args, **kwargs):
+        raise AssertionError("the translator was called")
+
+    monkeypatch.setattr(translation, "GoogleTranslator", offline)
+    doc = {"metadata": {"title": "cats"}, "boxes": ["cats are better than dogs", "change my mind"]}
+    context = json.loads(rag.format_context_tr([doc]))
+    assert context["boxes"] == ["cats are better than dogs", "fikrimi değiştir"]
+    assert context["metadata"]["title"] == "cats"
+    assert doc["boxes"][1] == "change my mind"
+
+
+def test_cache_calls_the_translator_once_per_string(monkeypatch, tmp_path):
+    calls = []
+
+    class FakeTranslator:
+        def __init__(self, source, target):
+            self.target = target
+
+        def translate(self, text):
+            calls.append(text)
+            return f"{self.target}:{text}"
+
+    monkeypatch.setattr(translation, "GoogleTranslator", FakeTranslator)
+    monkeypatch.setattr(translation, "PRECOMPUTED", {})
+    path = str(tmp_path / "translations.sqlite3")
+    cache = translation.TranslationCache(path, maxsize=1)
+    assert cache.translate("good morning", "tr", source="en") == "tr:good morning"
+    assert cache.translate("good morning", "tr", source="en") == "tr:good morning"
+    cache.translate("good night", "tr", source="en")  # evicts "good morning" from memory
+    assert cache.translate("good morning", "tr", source="en") == "tr:good morning"
+    # Another worker (or a restart) reads the shared store
+    other = translation.TranslationCache(path)
+    assert other.translate("good night", "tr", source="en") == "tr:good night"
+    assert calls == ["good morning", "good night"]
+    assert (cache.memory_hits, cache.store_hits, cache.misses) == (1, 1, 2)
+    assert other.store_hits == 1